@@ -8,7 +8,7 @@ ext_modules = [
     Extension(
         "bitboard", ["src/ccode/bitboard.pyx"], include_dirs=[numpy.get_include()]
     ),
-    Extension("solver", ["src/ccode/solver.pyx"], include_dirs=[numpy.get_include()]),
+    Extension("solver", ["src/ccode/solver.pyx"], include_dirs=[]),
     Extension("mcts_utils", ["src/ccode/mcts_utils.pyx"], include_dirs=[]),
 ]
 
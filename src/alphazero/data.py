@@ -7,84 +7,212 @@ In-memory format (as a list):
  - value: Tensor () [float32]
 
 On-disk format (to save space and quicken loading):
- - board: int64
+ - black: bytes (8, big-endian uint64)
+ - white: bytes (8, big-endian uint64)
  - move: int64
  - value: float32
 """
 
-from typing import Dict, Tuple
+import struct
+from typing import Dict, List, Tuple
 
+import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
-from board import BOARD_SHAPE, BOARD_SQUARES, Board, Loc
+from board import BOARD_SQUARES, Board, Loc
 
 EXAMPLE_SPEC = {
-    "board": tf.io.FixedLenFeature([2], tf.int64),
+    "black": tf.io.FixedLenFeature([], tf.string),
+    "white": tf.io.FixedLenFeature([], tf.string),
     "move": tf.io.FixedLenFeature([], tf.int64),
     "value": tf.io.FixedLenFeature([], tf.float32),
 }
 
 
-# Hack to allow storing bitboards efficiently as tf.Int64.
-# Necessary because boards are all valid uint64 but not necessarily valid int64.
-# Taken from: https://stackoverflow.com/questions/20766813/how-to-convert-signed-to-
-#             unsigned-integer-in-python
-def _signed_representation(unsigned: int) -> int:
-    """Convert an "unsigned" int to its equivalent C "signed" representation."""
-    return (unsigned & ((1 << 63) - 1)) - (unsigned & (1 << 63))
+# Maps each byte to its bits, most significant first.
+# Bitboards start from the most significant bit, so each byte unpacks to a board row.
+UNPACK_TABLE = tf.constant(
+    np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1),
+    dtype=tf.float32,
+)
 
 
-def _unsigned_representation(signed: int) -> int:
-    """Convert a "signed" int to its equivalent C "unsigned" representation."""
-    return signed & 0xFFFFFFFFFFFFFFFF
-
-
-# See: https://stackoverflow.com/questions/48333210/tensorflow-how-to-convert-an-
-#      integer-tensor-to-the-corresponding-binary-tensor
 def decode_bitboard(encoded: tf.Tensor) -> tf.Tensor:
     """
-    Convert from uint64 board representation to a tf.Tensor board.
+    Convert from serialized uint64 board representation to a tf.Tensor board.
     """
-    flat = tf.math.mod(
-        tf.bitwise.right_shift(encoded, tf.range(BOARD_SQUARES, dtype=tf.int64)), 2
+    # Bytes are stored most significant first, which is already row order
+    rows = tf.io.decode_raw(encoded, tf.uint8)
+    return tf.gather(UNPACK_TABLE, tf.cast(rows, tf.int32))
+
+
+# Hand-packed protobuf encoding of tf.train.Example, used by serialize_example.
+# Every feature holds one fixed-size value, so all tags and lengths are constants.
+# See: https://developers.google.com/protocol-buffers/docs/encoding
+_BYTES_LIST = 1  # tf.train.Feature field numbers
+_FLOAT_LIST = 2
+_INT64_LIST = 3
+
+
+def _field_header(field_number: int, length: int) -> bytes:
+    """Tag and length of a length-delimited protobuf field shorter than 128 bytes."""
+    return bytes([field_number << 3 | 2, length])
+
+
+def _feature_header(name: str, list_field: int, value_bytes: int) -> bytes:
+    """Encoding of a single-value feature map entry, up to the value itself."""
+    key = name.encode("utf-8")
+    list_header = _field_header(1, value_bytes)
+    feature_header = _field_header(list_field, len(list_header) + value_bytes)
+    feature_len = len(feature_header) + len(list_header) + value_bytes
+    entry = _field_header(1, len(key)) + key + _field_header(2, feature_len)
+    return (
+        _field_header(1, len(entry) + feature_len)
+        + entry
+        + feature_header
+        + list_header
     )
-    board = tf.reshape(flat, BOARD_SHAPE)
 
-    # Hack to allow using rot90 on a 2D tensor
-    return tf.image.rot90(tf.expand_dims(board, axis=-1), k=2)[:, :, 0]
+
+_BLACK_HEADER = _feature_header("black", _BYTES_LIST, 8)
+_WHITE_HEADER = _feature_header("white", _BYTES_LIST, 8)
+_MOVE_HEADER = _feature_header("move", _INT64_LIST, 1)  # Moves are 1-byte varints
+_VALUE_HEADER = _feature_header("value", _FLOAT_LIST, 4)
+_FEATURES_LEN = (
+    len(_BLACK_HEADER + _WHITE_HEADER + _MOVE_HEADER + _VALUE_HEADER) + 8 + 8 + 1 + 4
+)
+_EXAMPLE_HEADER = _field_header(1, _FEATURES_LEN) + _BLACK_HEADER
+_EXAMPLE_STRUCT = struct.Struct(
+    f"<{len(_EXAMPLE_HEADER)}s8s{len(_WHITE_HEADER)}s8s"
+    f"{len(_MOVE_HEADER)}sB{len(_VALUE_HEADER)}sf"
+)
 
 
-def serialize_example(board: Board, move: Loc, value: float) -> str:
+def serialize_example(board: Board, move: Loc, value: float) -> bytes:
     """
-    Serialize a single training example into a string.
+    Serialize a single training example into bytes.
     """
-    black = _signed_representation(int(board.black))
-    white = _signed_representation(int(board.white))
+    black = int(board.black).to_bytes(8, "big")
+    white = int(board.white).to_bytes(8, "big")
+    move_int = move.as_int
+
+    if 0 <= move_int < 128:
+        return _EXAMPLE_STRUCT.pack(
+            _EXAMPLE_HEADER,
+            black,
+            _WHITE_HEADER,
+            white,
+            _MOVE_HEADER,
+            move_int,
+            _VALUE_HEADER,
+            value,
+        )
+
+    # Moves outside the 1-byte varint range need the general encoder
     features = {
-        "board": tf.train.Feature(int64_list=tf.train.Int64List(value=[black, white])),
-        "move": tf.train.Feature(int64_list=tf.train.Int64List(value=[move.as_int])),
+        "black": tf.train.Feature(bytes_list=tf.train.BytesList(value=[black])),
+        "white": tf.train.Feature(bytes_list=tf.train.BytesList(value=[white])),
+        "move": tf.train.Feature(int64_list=tf.train.Int64List(value=[move_int])),
         "value": tf.train.Feature(float_list=tf.train.FloatList(value=[value])),
     }
     ex = tf.train.Example(features=tf.train.Features(feature=features))
     return ex.SerializeToString()
 
 
-def preprocess_example(
-    serialized: str
+# The same records as _EXAMPLE_STRUCT, laid out for serializing whole batches at once
+_EXAMPLE_DTYPE = np.dtype(
+    [
+        ("example_header", np.uint8, len(_EXAMPLE_HEADER)),
+        ("black", ">u8"),
+        ("white_header", np.uint8, len(_WHITE_HEADER)),
+        ("white", ">u8"),
+        ("move_header", np.uint8, len(_MOVE_HEADER)),
+        ("move", np.uint8),
+        ("value_header", np.uint8, len(_VALUE_HEADER)),
+        ("value", "<f4"),
+    ]
+)
+
+
+def serialize_examples(
+    blacks: np.ndarray, whites: np.ndarray, moves: np.ndarray, values: np.ndarray
+) -> List[bytes]:
+    """
+    Serialize a batch of training examples, each exactly as serialize_example would.
+    Takes arrays of black and white bitboards, moves (as Loc.as_int) and values,
+    and returns each example's serialized bytes.
+    """
+    if not ((0 <= moves) & (moves < 128)).all():
+        return [
+            serialize_example(Board(black, white), Loc.from_int(move), value)
+            for black, white, move, value in zip(
+                blacks.tolist(), whites.tolist(), moves.tolist(), values.tolist()
+            )
+        ]
+
+    # Every record has the same layout, so the whole batch is packed in one buffer
+    records = np.empty(len(moves), dtype=_EXAMPLE_DTYPE)
+    records["example_header"] = np.frombuffer(_EXAMPLE_HEADER, dtype=np.uint8)
+    records["black"] = blacks
+    records["white_header"] = np.frombuffer(_WHITE_HEADER, dtype=np.uint8)
+    records["white"] = whites
+    records["move_header"] = np.frombuffer(_MOVE_HEADER, dtype=np.uint8)
+    records["move"] = moves
+    records["value_header"] = np.frombuffer(_VALUE_HEADER, dtype=np.uint8)
+    records["value"] = values
+
+    buffer = records.tobytes()
+    size = _EXAMPLE_DTYPE.itemsize
+    return [buffer[i : i + size] for i in range(0, len(buffer), size)]  # noqa
+
+
+def preprocess_batch(
+    serialized: tf.Tensor
 ) -> Tuple[Dict[str, tf.Tensor], Dict[str, tf.Tensor]]:
     """
-    Turn a serialized example into the training-ready format.
+    Turn a batch of serialized examples into the training-ready format.
     """
 
-    example = tf.io.parse_single_example(serialized, EXAMPLE_SPEC)
-    bitboards = example["board"]
-    black_bb = bitboards[0]
-    white_bb = bitboards[1]
-    black = decode_bitboard(black_bb)
-    white = decode_bitboard(white_bb)
+    examples = tf.io.parse_example(serialized, EXAMPLE_SPEC)
+    black = decode_bitboard(examples["black"])
+    white = decode_bitboard(examples["white"])
     board = tf.stack([black, white], axis=-1)
-    move = tf.one_hot(example["move"], BOARD_SQUARES)
+    move = tf.one_hot(examples["move"], BOARD_SQUARES)
     # TODO: better solution to multi-input Keras model training
     return (
         {"board": board},
-        {"policy_softmax": move, "tf_op_layer_Tanh": example["value"]},
+        {"policy_softmax": move, "tf_op_layer_Tanh": examples["value"]},
+    )
+
+
+def load_dataset(
+    filenames: List[str], batch_size: int, cache: bool = False
+) -> tf.data.Dataset:
+    """
+    Load batches of training-ready examples from TFRecord files.
+
+    Files are read in parallel, and examples are batched before parsing so that
+    decoding runs once per batch.
+
+    Parameters
+    ----------
+    filenames : List[str]
+        TFRecord files (shards) to read.
+    batch_size : int
+        Examples per batch. The last partial batch is dropped.
+    cache : bool
+        If True, keep serialized examples in memory after the first epoch.
+    """
+    autotune = tf.data.experimental.AUTOTUNE
+    records = tf.data.Dataset.from_tensor_slices(filenames).interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=min(len(filenames), 8),
+        num_parallel_calls=autotune,
+    )
+    if cache:
+        records = records.cache()
+
+    return (
+        records.batch(batch_size, drop_remainder=True)
+        .map(preprocess_batch, num_parallel_calls=autotune)
+        .prefetch(autotune)
     )
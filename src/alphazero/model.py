@@ -1,3 +1,6 @@
+from typing import Iterator, List, Optional
+
+import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
 import tensorflow.keras.layers as L  # type: ignore
 
@@ -105,3 +108,42 @@ def get_network(
     value = tf.keras.activations.tanh(value)
 
     return tf.keras.Model(inputs=inputs_, outputs=[policy, value])
+
+
+def to_tflite(
+    model: tf.keras.Model,
+    fp16: bool = False,
+    calibration_boards: Optional[np.ndarray] = None,
+) -> bytes:
+    """
+    Convert a network to a TensorFlow Lite flatbuffer for inference.
+
+    Parameters
+    ----------
+    model : tf.keras.Model
+        A (policy, value) network.
+    fp16 : bool
+        If True, store weights as float16, halving the model's memory traffic.
+    calibration_boards : Optional[np.ndarray]
+        If given, typical (B, 8, 8, 2) network inputs. Used to quantize weights and
+        activations to int8, which overrides fp16. Inputs and outputs stay float32.
+
+    Returns
+    -------
+    bytes
+        The serialized TensorFlow Lite model.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration_boards is not None:
+
+        def representative_dataset() -> Iterator[List[np.ndarray]]:
+            for board in calibration_boards.astype(np.float32):
+                yield [board[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif fp16:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
@@ -6,29 +6,55 @@ and not the wrapped C functions.
 
 Attributes
 ----------
-PlayerColor : Enum
+PlayerColor : IntEnum
     A player's color.
 GameOutcome : Enum
     The outcome of an Othello game.
+OPPONENT : Tuple[PlayerColor, PlayerColor]
+    Each color's opponent's color, indexed by color.
+WINNING_OUTCOME : Tuple[GameOutcome, GameOutcome]
+    The outcome where each color wins, indexed by color.
 Loc : NamedTuple
     A pretty-printed and named (x, y) tuple representing a location on the board.
-Bitboard : class
-    A single player's set of pieces.
+Bitboard : type
+    A single player's set of pieces, stored as a 64-bit int.
 Board : class
     A complete Othello board.
+STARTING_BOARD : Board
+    The board every game starts from.
+popcount : function
+    Count the pieces in a bitboard.
+piecearray : function
+    Convert a bitboard to a boolean ndarray of pieces.
+from_piecearray : function
+    Convert a boolean ndarray of pieces to a bitboard.
+iter_locs : function
+    Iterate over the locations of the pieces in a bitboard.
+loc_list : function
+    List the locations of the pieces in a bitboard.
+square_list : function
+    List the squares (Loc.as_int) of the pieces in a bitboard.
+random_loc : function
+    Pick the location of a random piece in a bitboard.
+replay_moves : function
+    Play a sequence of moves from the starting board.
 """
 
-from enum import Enum, auto
+from enum import Enum, IntEnum
+from operator import itemgetter
+from random import randrange
 from string import ascii_lowercase
-from typing import List, NamedTuple, Tuple
+from typing import Iterator, List, NamedTuple, Tuple
 
 import numpy as np  # type: ignore
 
 from bitboard import (  # type: ignore
     bitboard_find_moves,
+    bitboard_replay,
+    bitboard_select_square,
+    bitboard_squares,
     bitboard_stability,
     deserialize_piecearray,
-    make_singleton_bitboard,
     popcount,
     resolve_move,
     serialize_piecearray,
@@ -41,9 +67,9 @@ BOARD_SQUARES = BOARD_SIZE * BOARD_SIZE
 
 # NOTE: values align between these two enums to allow comparison
 class GameOutcome(Enum):
-    BLACK_WINS = "black"
-    WHITE_WINS = "white"
-    DRAW = auto()
+    BLACK_WINS = 0
+    WHITE_WINS = 1
+    DRAW = 2
 
     @property
     def opponent(self) -> "GameOutcome":
@@ -54,21 +80,27 @@ class GameOutcome(Enum):
         return GameOutcome.DRAW
 
 
-class PlayerColor(Enum):
-    BLACK = "black"
-    WHITE = "white"
+# An IntEnum so that comparisons and hashing stay in C, and colors can index tuples
+class PlayerColor(IntEnum):
+    BLACK = 0
+    WHITE = 1
 
-    @property
-    def opponent(self) -> "PlayerColor":
-        if self == PlayerColor.BLACK:
-            return PlayerColor.WHITE
-        return PlayerColor.BLACK
+    # Set on each member below, so reading them is a plain attribute lookup
+    opponent: "PlayerColor"
+    winning_outcome: GameOutcome
 
-    @property
-    def winning_outcome(self) -> GameOutcome:
-        if self == PlayerColor.BLACK:
-            return GameOutcome.BLACK_WINS
-        return GameOutcome.WHITE_WINS
+
+# Precomputed so that hot loops can skip Enum comparisons
+OPPONENT: Tuple[PlayerColor, PlayerColor] = (PlayerColor.WHITE, PlayerColor.BLACK)
+WINNING_OUTCOME: Tuple[GameOutcome, GameOutcome] = (
+    GameOutcome.BLACK_WINS,
+    GameOutcome.WHITE_WINS,
+)
+
+for _color in PlayerColor:
+    _color.opponent = OPPONENT[_color]
+    _color.winning_outcome = WINNING_OUTCOME[_color]
+del _color
 
 
 class Loc(NamedTuple):
@@ -78,7 +110,7 @@ class Loc(NamedTuple):
 
     @staticmethod
     def pass_loc() -> "Loc":
-        return Loc(-1, -1)
+        return _PASS_LOC
 
     @property
     def as_int(self) -> int:
@@ -93,35 +125,53 @@ class Loc(NamedTuple):
             return "pass"
         return ascii_lowercase[self.x] + str(self.y + 1)
 
-    def __lt__(self, other):
-        return self.x < other.x or self.y < other.y
 
+# Locs are immutable, so the hot paths share these instead of allocating new ones
+_PASS_LOC = Loc(-1, -1)
+_LOCS: Tuple[Loc, ...] = tuple(
+    Loc(sq % BOARD_SIZE, sq // BOARD_SIZE) for sq in range(BOARD_SQUARES)
+)
 
-class Bitboard(int):
-    "A single player's set of pieces."
+# A single player's set of pieces.
+# Kept as a plain int so that values pass to and from C code without conversion.
+Bitboard = int
 
-    @staticmethod
-    def singleton(x: int, y: int) -> "Bitboard":
-        return Bitboard(make_singleton_bitboard(x, y))
 
-    @staticmethod
-    def from_piecearray(piecearray: np.ndarray) -> "Bitboard":
-        return Bitboard(serialize_piecearray(piecearray))
+def piecearray(bitboard: Bitboard) -> np.ndarray:
+    return deserialize_piecearray(bitboard)
 
-    @property
-    def popcount(self) -> int:
-        return popcount(self)
 
-    @property
-    def piecearray(self) -> np.ndarray:
-        return deserialize_piecearray(self)
+def from_piecearray(array: np.ndarray) -> Bitboard:
+    return serialize_piecearray(array)
 
-    @property
-    def loc_list(self) -> List[Loc]:
-        return [Loc(x, y) for y, x in np.argwhere(self.piecearray)]
 
-    def __repr__(self) -> str:
-        return np.array2string(self.piecearray.astype("int"))
+def iter_locs(bitboard: Bitboard) -> Iterator[Loc]:
+    return map(_LOCS.__getitem__, bitboard_squares(bitboard))
+
+
+def loc_list(bitboard: Bitboard) -> List[Loc]:
+    return [_LOCS[square] for square in bitboard_squares(bitboard)]
+
+
+def square_list(bitboard: Bitboard) -> List[int]:
+    return bitboard_squares(bitboard)
+
+
+def random_loc(bitboard: Bitboard) -> Loc:
+    """
+    Pick the location of one of a nonempty bitboard's pieces uniformly at random.
+    Draws from the random module exactly as random.choice(loc_list(bitboard)) would.
+    """
+    return _LOCS[bitboard_select_square(bitboard, randrange(popcount(bitboard)))]
+
+
+# (my board, opponent board) getters, indexed by color
+_PLAYER_VIEW = (itemgetter(0, 1), itemgetter(1, 0))
+
+# Board characters, indexed by (has black piece) | (has white piece) << 1
+_PIECE_STR = " XO?"
+_PIECE_CHARS = np.array(list(_PIECE_STR))
+_COLUMN_HEADER = "  " + " ".join(ascii_lowercase[:BOARD_SIZE])
 
 
 class Board(NamedTuple):
@@ -129,70 +179,58 @@ class Board(NamedTuple):
     black: Bitboard
     white: Bitboard
 
-    @staticmethod
-    def from_player_view(
-        player_bitboard: Bitboard, opponent_bitboard: Bitboard, player: PlayerColor
-    ):
-        """
-        Given a player color, bitboard, and opponent's bitboard, make a Board.
-        """
-        return Board(
-            **{player.value: player_bitboard, player.opponent.value: opponent_bitboard}
-        )
-
     @staticmethod
     def starting_board() -> "Board":
-        return Board(Bitboard(0x0000000810000000), Bitboard(0x0000001008000000))
+        return STARTING_BOARD
 
     @property
     def is_terminal(self) -> bool:
-        return (not self.has_moves(PlayerColor.BLACK)) and (
-            not self.has_moves(PlayerColor.WHITE)
+        return not (
+            bitboard_find_moves(self.black, self.white)
+            or bitboard_find_moves(self.white, self.black)
         )
 
     def player_view(self, player: PlayerColor) -> Tuple[Bitboard, Bitboard]:
         """
         Retrieve (my board, opponent board) tuple.
         """
-        if player == PlayerColor.BLACK:
-            return self.black, self.white
-        return self.white, self.black
+        return _PLAYER_VIEW[player](self)
 
     def resolve_move(self, move: Loc, player: PlayerColor) -> "Board":
-        player_board, opponent_board = self.player_view(player)
-        new_player_board, new_opponent_board = resolve_move(
-            player_board, opponent_board, move.x, move.y
-        )
-        return Board.from_player_view(
-            Bitboard(new_player_board), Bitboard(new_opponent_board), player
-        )
+        x, y = move
+        return _RESOLVE_MOVE[player](self, x, y)
+
+    # The C functions used by these hot methods are bound as default arguments,
+    # so that each call looks them up as locals instead of globals.
+    # Callers should never pass these arguments.
 
-    def find_moves(self, player: PlayerColor) -> Bitboard:
-        player_board, opponent_board = self.player_view(player)
-        return Bitboard(bitboard_find_moves(player_board, opponent_board))
+    def find_moves(
+        self, player: PlayerColor, _find_moves=bitboard_find_moves
+    ) -> Bitboard:
+        return _find_moves(*_PLAYER_VIEW[player](self))
 
-    def has_moves(self, player: PlayerColor) -> bool:
-        return self.find_moves(player) != 0
+    def has_moves(self, player: PlayerColor, _find_moves=bitboard_find_moves) -> bool:
+        return _find_moves(*_PLAYER_VIEW[player](self)) != 0
 
-    def find_stability(self, player: PlayerColor) -> Bitboard:
-        player_board, opponent_board = self.player_view(player)
-        return Bitboard(bitboard_stability(player_board, opponent_board))
+    def find_stability(
+        self, player: PlayerColor, _stability=bitboard_stability
+    ) -> Bitboard:
+        return _stability(*_PLAYER_VIEW[player](self))
 
     @property
     def winning_player(self) -> GameOutcome:
-        black_score = self.black.popcount
-        white_score = self.white.popcount
-        if black_score > white_score:
+        margin = popcount(self.black) - popcount(self.white)
+        if margin > 0:
             return GameOutcome.BLACK_WINS
-        if white_score > black_score:
+        if margin < 0:
             return GameOutcome.WHITE_WINS
         return GameOutcome.DRAW
 
     def score_for_player(self, player: PlayerColor) -> int:
         winner = self.winning_player
-        if winner == player:
+        if winner is WINNING_OUTCOME[player]:
             return 1
-        if winner == player.opponent:
+        if winner is WINNING_OUTCOME[OPPONENT[player]]:
             return -1
         return 0
 
@@ -201,9 +239,65 @@ class Board(NamedTuple):
         board[0, 1:] = [x for x in ascii_lowercase[:BOARD_SIZE]]
         board[1:, 0] = range(1, BOARD_SIZE + 1)
         board[0, 0] = " "
-        board[1:, 1:][np.where(self.black.piecearray)] = "X"
-        board[1:, 1:][np.where(self.white.piecearray)] = "O"
+        codes = piecearray(self.black).astype(np.uint8) | (
+            piecearray(self.white).astype(np.uint8) << 1
+        )
+        board[1:, 1:] = _PIECE_CHARS[codes]
         return board
 
     def __repr__(self) -> str:
-        return np.array2string(self._string_array(), formatter={"numpystr": str})
+        # Same layout as printing _string_array, built without numpy
+        black = format(self.black, "064b")
+        white = format(self.white, "064b")
+        cells = [_PIECE_STR[(b == "1") | (w == "1") << 1] for b, w in zip(black, white)]
+        rows = [_COLUMN_HEADER]
+        for y in range(BOARD_SIZE):
+            row = cells[y * BOARD_SIZE : (y + 1) * BOARD_SIZE]  # noqa
+            rows.append(f"{y + 1} " + " ".join(row))
+        return "[[" + "]\n [".join(rows) + "]]"
+
+
+# Move resolution specialized for each color, indexed by color.
+# Boards are built with tuple.__new__ to skip the NamedTuple constructor's Python frame.
+def _resolve_black_move(
+    board: Board, x: int, y: int, _resolve_move=resolve_move, _new=tuple.__new__
+) -> Board:
+    # The C function returns (mover, opponent), which is already (black, white)
+    return _new(Board, _resolve_move(board.black, board.white, x, y))
+
+
+def _resolve_white_move(
+    board: Board, x: int, y: int, _resolve_move=resolve_move, _new=tuple.__new__
+) -> Board:
+    white, black = _resolve_move(board.white, board.black, x, y)
+    return _new(Board, (black, white))
+
+
+_RESOLVE_MOVE = (_resolve_black_move, _resolve_white_move)
+
+# Boards are immutable, so every game can share one starting board
+STARTING_BOARD = Board(0x0000000810000000, 0x0000001008000000)
+
+
+def replay_moves(
+    xs: np.ndarray, ys: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Board]:
+    """
+    Play moves (int8 arrays of x and y) from the starting board, up to the first pass.
+    Returns the black bitboards, white bitboards and players to move before each move
+    played, and the final board.
+    """
+    blacks = np.empty(len(xs), dtype=np.uint64)
+    whites = np.empty(len(xs), dtype=np.uint64)
+    players = np.empty(len(xs), dtype=np.int8)
+    n_played = bitboard_replay(
+        STARTING_BOARD.black, STARTING_BOARD.white, xs, ys, blacks, whites, players
+    )
+    blacks, whites, players = blacks[:n_played], whites[:n_played], players[:n_played]
+
+    if not n_played:
+        return blacks, whites, players, STARTING_BOARD
+    last = Board(int(blacks[-1]), int(whites[-1]))
+    last_move = Loc(int(xs[n_played - 1]), int(ys[n_played - 1]))
+    final = last.resolve_move(last_move, PlayerColor(int(players[-1])))
+    return blacks, whites, players, final
@@ -6,6 +6,8 @@ ctypedef stdint.uint64_t Bitboard
 
 cdef extern from "cbitboard.c":
     cpdef unsigned int popcount(Bitboard x)
+    cdef unsigned int leading_zeros(Bitboard x)
+    cdef unsigned int select_bit(Bitboard bitboard, unsigned int rank)
     cpdef Bitboard bitboard_resolve_move(Bitboard player, Bitboard opp,
                                          Bitboard new_disk)
     cpdef Bitboard make_singleton_bitboard(unsigned int x, unsigned int y)
@@ -14,8 +14,63 @@ cpdef Bitboard serialize_piecearray(np.ndarray arr):
 cpdef np.ndarray deserialize_piecearray(Bitboard serialized):
     cdef bytes bytestring = serialized.to_bytes(length=BOARD_SIZE, byteorder='big')
     cdef np.ndarray byte_arr = np.frombuffer(bytestring, dtype=np.uint8)
-    cdef np.ndarray flat = np.unpackbits(byte_arr)
-    return np.reshape(flat.astype(bool), (BOARD_SIZE, BOARD_SIZE))
+    # unpackbits gives 0s and 1s, which can be viewed as bools without a copy
+    cdef np.ndarray flat = np.unpackbits(byte_arr).view(bool)
+    return np.reshape(flat, (BOARD_SIZE, BOARD_SIZE))
+
+
+cpdef list bitboard_squares(Bitboard bitboard):
+    '''
+    List the squares (y * 8 + x) occupied in a bitboard, in increasing order.
+    Runs in time proportional to the number of occupied squares.
+    '''
+    cdef list squares = []
+    cdef unsigned int square
+    while bitboard:
+        # Squares are numbered from the most significant bit
+        square = leading_zeros(bitboard)
+        squares.append(square)
+        bitboard ^= (1ULL << 63) >> square
+    return squares
+
+
+cpdef unsigned int bitboard_select_square(Bitboard bitboard, unsigned int index):
+    '''
+    Find the index-th (from 0) occupied square of a bitboard, in increasing order.
+    Runs in constant time; the bitboard must have more than index squares occupied.
+    '''
+    # select_bit counts ranks from the most significant bit, which is square 0,
+    # and returns a bit position from 1 (least significant) to 64
+    return 64 - select_bit(bitboard, index + 1)
+
+
+cpdef unsigned int bitboard_replay(Bitboard black, Bitboard white,
+                                   const signed char[:] xs, const signed char[:] ys,
+                                   Bitboard[:] blacks, Bitboard[:] whites,
+                                   signed char[:] players):
+    '''
+    Play moves (xs[i], ys[i]) from a board with black to move, up to the first pass
+    (a negative x). Each player keeps moving while their opponent has no moves.
+    Fills blacks, whites and players (0 for black, 1 for white) with the position
+    before each move played, and returns the number of moves played.
+    '''
+    cdef Bitboard mover = black, waiting = white, move_bitboard, new_disks
+    cdef signed char player = 0
+    cdef unsigned int i
+    for i in range(xs.shape[0]):
+        if xs[i] < 0:
+            return i
+        blacks[i], whites[i] = (mover, waiting) if player == 0 else (waiting, mover)
+        players[i] = player
+
+        move_bitboard = make_singleton_bitboard(xs[i], ys[i])
+        new_disks = bitboard_resolve_move(mover, waiting, move_bitboard)
+        mover = (mover ^ new_disks) | move_bitboard
+        waiting ^= new_disks
+        if bitboard_find_moves(waiting, mover):
+            mover, waiting = waiting, mover
+            player ^= 1
+    return xs.shape[0]
 
 
 # High-level functions
@@ -38,8 +93,8 @@ def resolve_move(Bitboard player, Bitboard opp, unsigned int x, unsigned int y):
     bool ndarray
         The opponent's new board.
     '''
-    cdef move_bitboard = make_singleton_bitboard(x, y)
-    cdef new_disks = bitboard_resolve_move(player, opp, move_bitboard)
+    cdef Bitboard move_bitboard = make_singleton_bitboard(x, y)
+    cdef Bitboard new_disks = bitboard_resolve_move(player, opp, move_bitboard)
     player = (player ^ new_disks) | move_bitboard
     opp ^= new_disks
     return (player, opp)
@@ -23,6 +23,20 @@ unsigned int popcount(uint64_t x) {
 #endif
 }
 
+// Index of the most significant set bit, counting from the top. x must be nonzero.
+unsigned int leading_zeros(uint64_t x) {
+#ifdef __GNUC__
+    return __builtin_clzll(x);
+#else
+    unsigned int n = 0;
+    while (!(x & 0x8000000000000000ULL)) {
+        x <<= 1U;
+        n += 1;
+    }
+    return n;
+#endif
+}
+
 //bitmasks to filter out certain Files
 const uint64_t _notAFile = 0xfefefefefefefefe; // ~0x0101010101010101
 const uint64_t _notHFile = 0x7f7f7f7f7f7f7f7f; // ~0x8080808080808080
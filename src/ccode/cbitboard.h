@@ -6,6 +6,7 @@
 #include <stdio.h>
 
 unsigned int popcount(uint64_t x);
+unsigned int leading_zeros(uint64_t x);
 uint64_t bitboard_extract_disk(uint64_t bitboard);
 uint64_t bitboard_resolve_move(uint64_t player, uint64_t opp, uint64_t new_disk);
 uint64_t make_singleton_bitboard(unsigned int x, unsigned int y);
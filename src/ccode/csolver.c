@@ -25,6 +25,7 @@ static inline int negamax_fastest_first(uint64_t player, uint64_t opp, int alpha
                                         int beta, bool passed, int depth);
 static inline int move_index(uint64_t bitboard);
 
+// Unless BENCHMARK is defined, the returned score is only a win/draw/loss bound
 move bitboard_solve_game(uint64_t player, uint64_t opp) {
     move result;
 
@@ -36,6 +37,7 @@ move bitboard_solve_game(uint64_t player, uint64_t opp) {
     uint64_t opp_board;
     int score;
     int max_score = -_INFINITY;
+    int alpha = -INITIAL_BOUND;
     int index = -1;
 
     while (moves != 0) {
@@ -45,12 +47,21 @@ move bitboard_solve_game(uint64_t player, uint64_t opp) {
         player_board = (player ^ new_disks) | new_move;
         opp_board = opp ^ new_disks;
 
+        // Later moves only need to prove they beat the best score so far
         score = -negamax_fastest_first(opp_board, player_board, -INITIAL_BOUND,
-                                       INITIAL_BOUND, false, depth);
+                                       -alpha, false, depth);
 
         if (score > max_score) {
             max_score = score;
             index = move_index(new_move);
+
+            if (max_score > alpha) {
+                alpha = max_score;
+
+                if (alpha >= INITIAL_BOUND) { // No move can do better
+                    break;
+                }
+            }
         }
     }
 
@@ -214,10 +225,14 @@ static inline unsigned int mobility(uint64_t player, uint64_t opp) {
 }
 
 static inline int move_index(uint64_t bitboard) {
+#ifdef __GNUC__
+    return __builtin_ctzll(bitboard);
+#else
     int i = 0;
     while (!(bitboard & (uint64_t) 1)) {
         bitboard = bitboard >> 1ULL;
         i += 1;
     }
     return i;
+#endif
 }
@@ -1,13 +1,17 @@
 # cython: language_level=3, boundscheck=False, wraparound=False
-from cpython cimport array
-from libc.stdlib cimport malloc, free, rand
+import logging
+from time import perf_counter_ns
+
+import numpy as np
 
-from bitboard cimport Bitboard, bitboard_find_moves, popcount, bitboard_resolve_move
+from cpython cimport array
+from libc.math cimport log, sqrt
+from libc.stdlib cimport malloc, free, rand, srand
 
-from board import GameOutcome, PlayerColor
+from bitboard cimport (Bitboard, bitboard_find_moves, popcount, bitboard_resolve_move,
+                       make_singleton_bitboard, select_bit)
 
-cdef extern from "cbitboard.c":
-    cdef unsigned int select_bit(Bitboard bitboard, unsigned int rank)
+from board import WINNING_OUTCOME, Board, GameOutcome, Loc, PlayerColor
 
 cpdef enum Rollout_Result: ACTIVE, OPPONENT, DRAW
 
@@ -50,6 +54,13 @@ cdef Rollout_Result _random_rollout(Bitboard active_bitboard, Bitboard other_bit
     return OPPONENT
 
 ### Top-level functions ###
+def seed_rollouts(unsigned int seed) -> None:
+    '''
+    Seed the C random number generator used by random_rollout.
+    '''
+    srand(seed)
+
+
 def random_rollout(
     active_bitboard: int, opponent_bitboard: int, player: PlayerColor
 ) -> GameOutcome:
@@ -59,3 +70,235 @@ def random_rollout(
         ACTIVE: player.winning_outcome,
         OPPONENT: player.opponent.winning_outcome
     }[result]
+
+
+### Search tree kernels ###
+# These work on the parallel node arrays of the players' NodePools, so that descent
+# and backup run as native loops. Each mirrors the arithmetic of the Python code it
+# replaced exactly, including taking the first of tied scores.
+
+def select_uct_path(
+    double[::1] value,
+    double[::1] visits,
+    int[::1] first_child,
+    int[::1] n_moves,
+    int[::1] n_explored,
+    int root,
+    double explore_coeff,
+) -> list:
+    '''
+    Follow UCT scores from root through fully explored nodes, for the MCTS player.
+    Returns the path, ending at a node with untried moves or a terminal node.
+    '''
+    cdef int node = root
+    cdef int child, best
+    cdef double log_visits, score, best_score
+    path = [node]
+
+    while n_moves[node] and n_explored[node] == n_moves[node]:
+        log_visits = log(visits[node])
+        best = first_child[node]
+        best_score = 0
+        for child in range(first_child[node], first_child[node] + n_explored[node]):
+            score = value[child] / visits[child] + explore_coeff * sqrt(
+                log_visits / visits[child]
+            )
+            if child == first_child[node] or score > best_score:
+                best = child
+                best_score = score
+        node = best
+        path.append(node)
+
+    return path
+
+
+def backup_outcome(
+    double[::1] value,
+    double[::1] visits,
+    signed char[::1] player,
+    list path,
+    int outcome,
+) -> None:
+    '''
+    Record a GameOutcome's value at every node of a path, for the MCTS player.
+    Nodes are valued for the player who moved into them.
+    '''
+    cdef int node
+    cdef int draw = GameOutcome.DRAW.value
+    for node in path:
+        visits[node] += 1
+        if outcome == draw:
+            value[node] += 0.5
+        elif outcome != player[node]:
+            value[node] += 1
+
+
+def select_puct_path(
+    double[::1] value,
+    double[::1] visits,
+    double[::1] virtual_losses,
+    double[::1] policy_prior,
+    int[::1] first_child,
+    int[::1] n_children,
+    int root,
+    double explore_coeff,
+) -> list:
+    '''
+    Follow PUCT scores from root to a leaf, for the AlphaZero player.
+    Each virtual loss counts as a visit the parent lost.
+    '''
+    cdef int node = root
+    cdef int child, best
+    cdef double explore_scale, child_visits, score, best_score
+    path = [node]
+
+    while first_child[node] >= 0:  # Terminal nodes are never expanded
+        explore_scale = explore_coeff * sqrt(visits[node] + virtual_losses[node])
+        best = first_child[node]
+        best_score = 0
+        for child in range(first_child[node], first_child[node] + n_children[node]):
+            child_visits = visits[child] + virtual_losses[child]
+            score = policy_prior[child] * explore_scale / (1 + child_visits)
+            score -= (value[child] + virtual_losses[child]) / max(child_visits, 1)
+            if child == first_child[node] or score > best_score:
+                best = child
+                best_score = score
+        node = best
+        path.append(node)
+
+    return path
+
+
+def backup_value(
+    double[::1] value,
+    double[::1] visits,
+    signed char[::1] player,
+    list path,
+    double leaf_value,
+) -> float:
+    '''
+    Back up a leaf's value along a path from the root, for the AlphaZero player.
+    Returns the value for the player at the root.
+    '''
+    cdef Py_ssize_t i
+    cdef int parent, child
+    for i in range(len(path) - 1, 0, -1):
+        parent = path[i - 1]
+        child = path[i]
+        if player[parent] != player[child]:
+            leaf_value = -leaf_value
+        value[parent] += leaf_value
+        visits[parent] += 1
+    return leaf_value
+
+
+def subtree_order(int[::1] first_child, int[::1] n_children, int root) -> tuple:
+    '''
+    Order the nodes of the subtree under root breadth-first, so that it can be copied
+    into a fresh pool. Each node's children stay contiguous, in the same order.
+
+    Returns (order, new_first_child): the old index of each node in the new order,
+    and each node's first child in the new order (-1 when it has no children).
+    '''
+    order_array = np.empty(len(first_child), dtype=np.int32)
+    new_first_child_array = np.empty(len(first_child), dtype=np.int32)
+    cdef int[::1] order = order_array
+    cdef int[::1] new_first_child = new_first_child_array
+    cdef int head = 0
+    cdef int tail = 1
+    cdef int node, child
+
+    order[0] = root
+    while head < tail:
+        node = order[head]
+        if first_child[node] >= 0 and n_children[node] > 0:
+            new_first_child[head] = tail
+            for child in range(first_child[node], first_child[node] + n_children[node]):
+                order[tail] = child
+                tail += 1
+        else:
+            new_first_child[head] = -1
+        head += 1
+
+    return order_array[:tail], new_first_child_array[:tail]
+
+
+def play_game_from_bitboards(
+    Bitboard black_bitboard,
+    Bitboard white_bitboard,
+    current_player: PlayerColor,
+    black,
+    white,
+    black_time,
+    white_time,
+    bint show_board,
+) -> GameOutcome:
+    '''
+    Play a game of Othello between two initialized players, starting from a given
+    state. Board updates between moves stay in C; Python is only re-entered to ask
+    the players for moves.
+
+    See game.play_game_from_state for parameters.
+    '''
+    cdef Bitboard bitboards[2]
+    cdef unsigned int color = current_player
+    cdef Bitboard legal_moves
+    cdef Bitboard new_move
+    cdef Bitboard new_disks
+    cdef bint just_passed = False
+
+    bitboards[0] = black_bitboard
+    bitboards[1] = white_bitboard
+    pass_loc = Loc.pass_loc()
+    last_move = None
+
+    # The mover's and the waiting player's state, swapped after every ply
+    get_move, other_get_move = black.get_move, white.get_move
+    time_left, other_time_left = black_time, white_time
+    if color:
+        get_move, other_get_move = other_get_move, get_move
+        time_left, other_time_left = other_time_left, time_left
+
+    while True:
+        legal_moves = bitboard_find_moves(bitboards[color], bitboards[color ^ 1])
+        board = Board(bitboards[0], bitboards[1])
+
+        # Only read the clock for players with a time budget
+        if time_left is None:
+            move = get_move(board, last_move, None, legal_moves)
+        else:
+            t1 = perf_counter_ns()
+            move = get_move(board, last_move, time_left, legal_moves)
+            time_left -= (perf_counter_ns() - t1) // 1000000
+
+        # Players normally return the shared pass Loc, which skips the tuple compare
+        if move is pass_loc or move == pass_loc:
+            if just_passed:
+                break
+            just_passed = True
+            last_move = None
+        else:
+            just_passed = False
+            last_move = move
+            x, y = move
+            new_move = make_singleton_bitboard(x, y)
+            new_disks = bitboard_resolve_move(bitboards[color], bitboards[color ^ 1],
+                                              new_move)
+            bitboards[color] = (bitboards[color] ^ new_disks) | new_move
+            bitboards[color ^ 1] ^= new_disks
+
+        if show_board:
+            print(Board(bitboards[0], bitboards[1]))
+
+        if time_left is not None and time_left < 0:
+            logging.error("Player %s timed out.", PlayerColor(color).name.lower())
+            return WINNING_OUTCOME[color ^ 1]
+
+        color ^= 1
+        get_move, other_get_move = other_get_move, get_move
+        time_left, other_time_left = other_time_left, time_left
+
+    board = Board(bitboards[0], bitboards[1])
+    if show_board:
+        print(board)
+    return board.winning_player
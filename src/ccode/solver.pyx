@@ -1,18 +1,15 @@
 # cython: language_level=3, boundscheck=False, wraparound=False
-import numpy as np
-cimport numpy as np
+from bitboard cimport Bitboard
 
-from bitboard import serialize_piecearray
-
-cpdef solve_game(np.ndarray player, np.ndarray opp):
+cpdef solve_game(Bitboard player, Bitboard opp):
     '''
     Solve a board with the explicit endgame solver, returning the best next move.
 
     Parameters
     ----------
-    player : bool ndarray
+    player : Bitboard
         Active player's board.
-    opp : bool ndarray
+    opp : Bitboard
         Opponent's board.
 
     Returns
@@ -21,8 +18,9 @@ cpdef solve_game(np.ndarray player, np.ndarray opp):
     y : int
         Coordinates of the best move on this board.
     score : int
-        Expected final score.
+        Bound on the final score under best play: positive if the move wins, zero
+        if it draws, negative if it loses. Only the sign is exact, since the search
+        only proves whether each move wins, draws or loses.
     '''
-    cdef move c_move = bitboard_solve_game(serialize_piecearray(player),
-                                           serialize_piecearray(opp))
+    cdef move c_move = bitboard_solve_game(player, opp)
     return (7 - c_move.x, 7 - c_move.y, c_move.score)
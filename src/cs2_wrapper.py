@@ -10,21 +10,22 @@ argument specifying the color. Otherwise, color can be passed explicitly.
 import sys
 from typing import Optional
 
-from board import Board, Loc, PlayerColor
+from board import STARTING_BOARD, Loc, PlayerColor
 from player import PlayerABC
 
 
 def run_player(player: PlayerABC, color: Optional[PlayerColor] = None) -> None:
     if color is None:
         color = {"Black": PlayerColor.BLACK, "White": PlayerColor.WHITE}[sys.argv[1]]
-    board = Board.starting_board()
-    print(f"Player ready: {player.__class__.__name__} ({color.value})")
+    board = STARTING_BOARD
+    print(f"Player ready: {player.__class__.__name__} ({color.name.lower()})")
 
     while True:
         try:
             opp_x_, opp_y_, ms_left_ = input().split()
         except EOFError:
             player.logger.info("Game over!")
+            player.close()
             return
         opp_x, opp_y = int(opp_x_), int(opp_y_)
         ms_left: Optional[int] = int(ms_left_)
@@ -3,11 +3,10 @@ Functions to run Othello games.
 """
 
 
-import logging
-from time import monotonic
-from typing import Dict, Optional
+from typing import Optional
 
-from board import Board, GameOutcome, Loc, PlayerColor
+from board import STARTING_BOARD, Board, GameOutcome, PlayerColor
+from mcts_utils import play_game_from_bitboards  # type: ignore
 from player import PlayerABC
 
 
@@ -49,46 +48,21 @@ def play_game_from_state(
     black.initialize(PlayerColor.BLACK, black_time)
     white.initialize(PlayerColor.WHITE, white_time)
 
-    players: Dict[PlayerColor, PlayerABC] = {
-        PlayerColor.BLACK: black,
-        PlayerColor.WHITE: white,
-    }
-    times: Dict[PlayerColor, Optional[int]] = {
-        PlayerColor.BLACK: black_time,
-        PlayerColor.WHITE: white_time,
-    }
-    just_passed: bool = False
-    last_move: Optional[Loc] = None
-
-    while True:
-        t1 = monotonic()
-        move = players[current_player].get_move(board, last_move, times[current_player])
-        t2 = monotonic()
-
-        if move == Loc.pass_loc():
-            if just_passed:
-                break
-            just_passed = True
-            last_move = None
-        else:
-            just_passed = False
-            last_move = move
-            board = board.resolve_move(move, current_player)
-
-        if show_board:
-            print(board)
-
-        if times[current_player] is not None:
-            times[current_player] -= int((t2 - t1) * 1000)  # type: ignore
-            if times[current_player] < 0:  # type: ignore
-                logging.error(f"Player {current_player} timed out.")
-                return current_player.opponent.winning_outcome
-
-        current_player = current_player.opponent
-
-    if show_board:
-        print(board)
-    return board.winning_player
+    # The ply loop itself runs in Cython to keep per-move overhead low
+    try:
+        return play_game_from_bitboards(
+            board.black,
+            board.white,
+            current_player,
+            black,
+            white,
+            black_time,
+            white_time,
+            show_board,
+        )
+    finally:
+        black.close()
+        white.close()
 
 
 def play_game(
@@ -116,7 +90,7 @@ def play_game(
         The outcome of the game.
     """
     return play_game_from_state(
-        Board.starting_board(),
+        STARTING_BOARD,
         PlayerColor.BLACK,
         black,
         white,
@@ -1,11 +1,10 @@
 import logging
 from abc import ABC, abstractmethod
-from copy import deepcopy
+from functools import lru_cache
 from time import monotonic
-from types import MethodType
 from typing import Optional
 
-from board import BOARD_SQUARES, Board, Loc, PlayerColor
+from board import BOARD_SQUARES, Bitboard, Board, Loc, PlayerColor, popcount
 from solver import solve_game  # type: ignore
 from termcolor import colored
 
@@ -20,6 +19,24 @@ PlayerABC : ABC
 """
 
 
+@lru_cache(maxsize=None)
+def _get_player_logger(log_name: str) -> logging.Logger:
+    """
+    Get a configured logger for players with this name, setting it up on first use.
+    """
+    logger = logging.getLogger(log_name)
+    log_handler = logging.StreamHandler()
+    log_handler.setLevel(logging.DEBUG)
+    log_handler.setFormatter(
+        logging.Formatter(
+            fmt=f"{log_name} %(levelname)s >>- %(message)s", datefmt="%H:%M:%S"
+        )
+    )
+    logger.addHandler(log_handler)
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
 class PlayerABC(ABC):
     """
     ABC for Othello players.
@@ -50,18 +67,8 @@ class PlayerABC(ABC):
         self.color: PlayerColor = color
         self.ms_total: Optional[int] = ms_total
 
-        log_name = f"{self.__class__.__name__} ({self.color.value})"
-        self.logger: logging.Logger = logging.getLogger(log_name)
-        if not self.logger.handlers:
-            log_handler = logging.StreamHandler()
-            log_handler.setLevel(logging.DEBUG)
-            log_handler.setFormatter(
-                logging.Formatter(
-                    fmt=f"{log_name} %(levelname)s >>- %(message)s", datefmt="%H:%M:%S"
-                )
-            )
-            self.logger.addHandler(log_handler)
-        self.logger.setLevel(logging.DEBUG)
+        log_name = f"{self.__class__.__name__} ({self.color.name.lower()})"
+        self.logger: logging.Logger = _get_player_logger(log_name)
 
         if ms_total:
             self.logger.debug(
@@ -69,26 +76,64 @@ class PlayerABC(ABC):
             )
         self.logger.debug("Finished initializing player.")
 
+    def close(self) -> None:
+        """
+        Release anything this player holds for the game, such as worker processes.
+        Called by the game framework once the game is over; does nothing by default.
+        """
+
     def get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int]
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Optional[Bitboard] = None,
     ) -> Loc:
+        """
+        Get this player's next move. Used by the game framework; do not overwrite.
+
+        Parameters
+        ----------
+        board : Board
+            The current board.
+        opponent_move : Loc or None
+            Opponent's last move, if applicable.
+        ms_left : int or None
+            Milliseconds left in this bot's time budget.
+            If None, unlimited time is available.
+        legal_moves : Bitboard or None
+            This player's legal moves on the board, if the caller already found them.
+        """
         assert self._initialized
-        opp_fmt = "pass" if opponent_move is None else opponent_move.__repr__()
-        self.logger.info(f"Opponent's move: {colored(opp_fmt, 'red')}.")
+        # Colored messages are only built when they will be shown
+        log_moves = self.logger.isEnabledFor(logging.INFO)
+        if log_moves:
+            opp_fmt = "pass" if opponent_move is None else opponent_move.__repr__()
+            self.logger.info("Opponent's move: %s.", colored(opp_fmt, "red"))
+
+        if legal_moves is None:
+            legal_moves = board.find_moves(self.color)
 
         t1 = monotonic()
-        move = self._get_move(board, opponent_move, ms_left)
+        move = self._get_move(board, opponent_move, ms_left, legal_moves)
         t2 = monotonic()
 
-        move_count = board.white.popcount + board.black.popcount - 3
-        move_format = colored(move.__repr__(), "yellow")
-        time_format = colored(f"{t2 - t1:.2f} s", "green")
-        self.logger.info(f"Move {move_count}: {move_format} (time: {time_format}).\n")
+        if log_moves:
+            move_count = popcount(board.black | board.white) - 3
+            move_format = colored(move.__repr__(), "yellow")
+            time_format = colored(f"{t2 - t1:.2f} s", "green")
+            self.logger.info(
+                "Move %d: %s (time: %s).\n", move_count, move_format, time_format
+            )
         return move
 
     @abstractmethod
     def _get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int]
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
     ) -> Loc:
         """
         Get this player's next move.
@@ -105,6 +150,8 @@ class PlayerABC(ABC):
         ms_left : int or None
             Milliseconds left in this bot's time budget.
             If None, unlimited time is available.
+        legal_moves : Bitboard
+            This player's legal moves on the board. If 0, the player must pass.
 
         Returns
         -------
@@ -128,35 +175,52 @@ class PlayerABC(ABC):
         Returns
         -------
         PlayerABC
-            A copy of this player with a different _get_move function.
+            A player which makes this player's moves until the endgame.
         """
+        return _PlayerWithSolver(self, depth, time)
 
-        player = deepcopy(self)
-        __get_move = player._get_move
 
-        def _get_move(
-            self: PlayerABC,
-            board: Board,
-            opponent_move: Optional[Loc],
-            ms_left: Optional[int],
-        ) -> Loc:
-            empties = BOARD_SQUARES - board.white.popcount - board.black.popcount
+class _PlayerWithSolver(PlayerABC):
+    """
+    A player which delegates to another player until few enough spots are left empty,
+    then makes moves with the endgame solver. See PlayerABC.with_depth_solver.
+    """
 
-            if empties <= depth:
-                if not board.has_moves(self.color):
-                    return Loc.pass_loc()
+    def __init__(self, player: PlayerABC, depth: int, time: int):
+        self.player = player
+        self.depth = depth
+        self.time = time
 
-                self.logger.info(
-                    f"Running solver at depth: {colored(str(empties), 'cyan')}."
-                )
-                mine, opp = board.player_view(self.color)
-                x, y, _ = solve_game(mine.piecearray, opp.piecearray)
-                return Loc(x, y)
+    def initialize(self, color: PlayerColor, ms_total: Optional[int]) -> None:
+        super().initialize(color, ms_total)
+        # Log as the wrapped player, which needs its own color and logger anyway
+        self.player.initialize(color, ms_total)
+        self.logger = self.player.logger
+
+    def close(self) -> None:
+        self.player.close()
 
-            if ms_left:
-                ms_left -= time
+    def _get_move(
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
+    ) -> Loc:
+        empties = BOARD_SQUARES - popcount(board.black | board.white)
+
+        if empties <= self.depth:
+            if not legal_moves:
+                return Loc.pass_loc()
+
+            self.logger.info(
+                "Running solver at depth: %s.", colored(str(empties), "cyan")
+            )
+            mine, opp = board.player_view(self.color)
+            x, y, _ = solve_game(mine, opp)
+            return Loc(x, y)
 
-            return __get_move(board, opponent_move, ms_left)
+        if ms_left:
+            ms_left -= self.time
 
-        player._get_move = MethodType(_get_move, player)  # type: ignore
-        return player
+        return self.player._get_move(board, opponent_move, ms_left, legal_moves)
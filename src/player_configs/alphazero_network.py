@@ -1,14 +1,15 @@
 #!/usr/bin/env python
 # cython: language_level=3, boundscheck=False, wraparound=False
+import os
+import random
 from typing import Tuple
 
 import numpy as np  # type: ignore
-import tensorflow as tf  # type: ignore
 from absl import app, flags  # type: ignore
 
 import src.cs2_wrapper  # type: ignore
 import src.players.alphazero_player  # type: ignore
-from board import BOARD_SHAPE, PlayerColor
+from board import BOARD_SHAPE, STARTING_BOARD, PlayerColor, loc_list, piecearray
 
 FLAGS = flags.FLAGS
 
@@ -26,22 +27,140 @@ flags.DEFINE_integer(
     "sims", 100, "Number of simulations per turn if there is no time limit."
 )
 flags.DEFINE_integer("buffer_time", 80, "Milliseconds to reserve each turn.")
+flags.DEFINE_integer(
+    "batch_size", 8, "Number of MCTS leaves to evaluate per network call."
+)
+flags.DEFINE_bool(
+    "tflite",
+    False,
+    "Run the network as a TensorFlow Lite model, cached next to the network.",
+)
+flags.DEFINE_bool(
+    "fp16",
+    False,
+    "Run the network as a float16 TensorFlow Lite model, cached next to the network.",
+)
+flags.DEFINE_bool(
+    "int8",
+    False,
+    "Run the network as an int8 TensorFlow Lite model, cached next to the network.",
+)
+
+# Random games played to collect boards for int8 calibration
+N_CALIBRATION_GAMES = 20
+
+
+# TensorFlow is imported only where needed: evaluating a converted TensorFlow Lite
+# network with tflite_runtime avoids its multi-second import and model loading.
+
+
+def keras_evaluator(network_path: str) -> src.players.alphazero_player.Evaluator:
+    import tensorflow as tf  # type: ignore
+
+    model = tf.keras.models.load_model(network_path)
+
+    # Traced once for every batch size, skipping predict's per-call dataset setup
+    @tf.function(
+        input_signature=[tf.TensorSpec(model.input_shape, tf.float32)], autograph=False
+    )
+    def forward(boards: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        return model(boards, training=False)
+
+    def evaluator(boards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        policy, value = forward(boards.astype(np.float32, copy=False))
+        policy = np.reshape(policy.numpy(), (-1, *BOARD_SHAPE))
+        return policy, value.numpy()[:, 0]
+
+    return evaluator
+
+
+def calibration_boards(n_games: int) -> np.ndarray:
+    """
+    Collect every position of some random games, as (B, 8, 8, 2) network inputs.
+    """
+    boards = []
+    for _ in range(n_games):
+        board, player = STARTING_BOARD, PlayerColor.BLACK
+        while not board.is_terminal:
+            moves = loc_list(board.find_moves(player))
+            if moves:
+                mine, opp = board.player_view(player)
+                boards.append(np.dstack([piecearray(mine), piecearray(opp)]))
+                board = board.resolve_move(random.choice(moves), player)
+            player = player.opponent
+    return np.stack(boards)
+
+
+def tflite_evaluator(
+    network_path: str, precision: str = "fp32"
+) -> src.players.alphazero_player.Evaluator:
+    """
+    Evaluate a network with TensorFlow Lite, at precision "fp32", "fp16" or "int8".
+    """
+    tflite_path = os.path.normpath(network_path) + f".{precision}.tflite"
+    if not os.path.exists(tflite_path):
+        import tensorflow as tf  # type: ignore
+
+        import src.alphazero.model  # type: ignore
+
+        model = tf.keras.models.load_model(network_path)
+        if precision == "int8":
+            tflite_model = src.alphazero.model.to_tflite(
+                model, calibration_boards=calibration_boards(N_CALIBRATION_GAMES)
+            )
+        else:
+            tflite_model = src.alphazero.model.to_tflite(
+                model, fp16=precision == "fp16"
+            )
+        with open(tflite_path, "wb") as f:
+            f.write(tflite_model)
+
+    try:
+        from tflite_runtime.interpreter import Interpreter  # type: ignore
+    except ImportError:
+        import tensorflow as tf  # type: ignore
+
+        Interpreter = tf.lite.Interpreter
+
+    interpreter = Interpreter(model_path=tflite_path)
+    input_index = interpreter.get_input_details()[0]["index"]
+    # Outputs are not kept in model order, so tell them apart by shape
+    outputs = sorted(interpreter.get_output_details(), key=lambda o: o["shape"][-1])
+    value_index, policy_index = [output["index"] for output in outputs]
+    batch_size = None
+
+    def evaluator(boards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        nonlocal batch_size
+        if len(boards) != batch_size:  # Only reallocate when the batch size changes
+            interpreter.resize_tensor_input(input_index, boards.shape)
+            interpreter.allocate_tensors()
+            batch_size = len(boards)
+
+        interpreter.set_tensor(input_index, boards.astype(np.float32, copy=False))
+        interpreter.invoke()
+        policy = np.reshape(interpreter.get_tensor(policy_index), (-1, *BOARD_SHAPE))
+        return policy, interpreter.get_tensor(value_index)[:, 0]
+
+    return evaluator
 
 
 def main(argv):
     color = argv[1]
-    model = tf.keras.models.load_model(FLAGS.network)
-
-    def network_evaluator(board: np.ndarray) -> Tuple[np.ndarray, float]:
-        policy, value = model.predict(np.expand_dims(board, axis=0).astype(np.float32))
-        policy = np.reshape(policy, BOARD_SHAPE)
-        return policy, value[0, 0]
+    if FLAGS.int8:
+        network_evaluator = tflite_evaluator(FLAGS.network, "int8")
+    elif FLAGS.fp16:
+        network_evaluator = tflite_evaluator(FLAGS.network, "fp16")
+    elif FLAGS.tflite:
+        network_evaluator = tflite_evaluator(FLAGS.network)
+    else:
+        network_evaluator = keras_evaluator(FLAGS.network)
 
     player = src.players.alphazero_player.AlphaZeroPlayer(
         evaluator=network_evaluator,
         explore_coeff=FLAGS.C,
         finalized=True,
         sims_per_turn=FLAGS.sims,
+        batch_size=FLAGS.batch_size,
     )
 
     if FLAGS.solver_depth > 0:
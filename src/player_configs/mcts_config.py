@@ -1,9 +1,28 @@
 #!/usr/bin/env python
 # cython: language_level=3, boundscheck=False, wraparound=False
 
+from absl import app, flags  # type: ignore
+
 import src.cs2_wrapper  # type: ignore
 import src.players.mcts_player  # type: ignore
 
-if __name__ == "__main__":
-    player = src.players.mcts_player.MCTSPlayer(explore_coeff=4, turn_ms_buffer=40)
+FLAGS = flags.FLAGS
+
+flags.DEFINE_float("C", 4, "MCTS exploration parameter.")
+flags.DEFINE_integer("buffer_time", 40, "Milliseconds to reserve each turn.")
+flags.DEFINE_integer(
+    "n_workers", 1, "Number of processes searching in parallel under a time limit."
+)
+
+
+def main(argv):
+    player = src.players.mcts_player.MCTSPlayer(
+        explore_coeff=FLAGS.C,
+        turn_ms_buffer=FLAGS.buffer_time,
+        n_workers=FLAGS.n_workers,
+    )
     src.cs2_wrapper.run_player(player)
+
+
+if __name__ == "__main__":
+    app.run(main)
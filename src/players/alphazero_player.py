@@ -1,129 +1,425 @@
+import logging
 import math
-from time import monotonic
-from typing import Callable, Dict, Optional, Tuple
+from time import monotonic_ns
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np  # type: ignore
-from scipy.special import softmax  # type: ignore
 
-from board import BOARD_SQUARES, Board, Loc, PlayerColor
+from board import (
+    BOARD_SIZE,
+    BOARD_SQUARES,
+    STARTING_BOARD,
+    Bitboard,
+    Board,
+    Loc,
+    PlayerColor,
+    iter_locs,
+    piecearray,
+    popcount,
+)
+from mcts_utils import (  # type: ignore
+    backup_value,
+    select_puct_path,
+    subtree_order,
+)
 from player import PlayerABC
 
-# Map from boards to (policy, value) pairs
-Evaluator = Callable[[np.ndarray], Tuple[np.ndarray, float]]
+# Map from a float32 batch of boards (B, 8, 8, 2) to (policies (B, 8, 8), values (B,))
+Evaluator = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+# Evaluator outputs, keyed by the (my board, opponent board) view the evaluator sees
+Evaluations = Dict[Tuple[Bitboard, Bitboard], Tuple[np.ndarray, float]]
+
+# Applied along paths still awaiting evaluation, so batched descents spread out
+VIRTUAL_LOSS = 1
+
+# Cached evaluations kept between turns before the cache is cleared
+MAX_CACHED_EVALUATIONS = 2 ** 16
+
+# Shared by all sampling in this module
+_rng = np.random.default_rng()
+
+
+def _board_arrays(views: Sequence[Tuple[Bitboard, Bitboard]]) -> np.ndarray:
+    """
+    Convert (my board, opponent board) views into a (B, 8, 8, 2) float32 array of
+    pieces, ready to be passed to a network without another copy.
+    """
+    # Big-endian bytes start from the most significant bit, which is square a1
+    bitboards = np.array(views, dtype=">u8").reshape(-1, 2)
+    bits = np.unpackbits(bitboards.view(np.uint8), axis=-1)
+    boards = np.moveaxis(bits.reshape(-1, 2, BOARD_SIZE, BOARD_SIZE), 1, -1)
+    # Converts and lays out the batch for the network in a single copy
+    return np.ascontiguousarray(boards, dtype=np.float32)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    """
+    Softmax over every entry of logits, computed in place. -inf entries become 0.
+    """
+    logits -= logits.max()
+    np.exp(logits, out=logits)
+    logits /= logits.sum()
+    return logits
+
+
+# Nodes allocated up front. The pool doubles in size whenever it fills.
+INITIAL_POOL_SIZE = 2 ** 16
+
+
+class NodePool:
+    """
+    Search tree nodes, stored as parallel arrays indexed by node number.
+
+    Nodes are never freed in place; moving on to a subtree copies it into a new
+    pool instead. Unallocated entries are kept zeroed (except first_child, which is
+    -1), so that allocating a node only writes the fields it sets.
+    A node's children are allocated together, so they occupy the contiguous range
+    first_child[node] : first_child[node] + n_children[node].
+    """
+
+    size: int  # Nodes allocated so far
+    black: np.ndarray
+    white: np.ndarray
+    player: np.ndarray  # The player to move
+    moves: np.ndarray  # Legal moves for the player to move
+    square: np.ndarray  # Loc.as_int of the move which led to each node; < 0 for pass
+    terminal: np.ndarray
+    score: np.ndarray  # Final result of terminal nodes, for the player to move
+    value: np.ndarray  # Total value backed up, for the player to move
+    visits: np.ndarray  # Floats, so that PUCT arithmetic needs no casts
+    virtual_losses: np.ndarray  # Descents in progress through each node
+    policy_prior: np.ndarray
+    first_child: np.ndarray  # -1 when we've never been visited
+    n_children: np.ndarray
+
+    _DTYPES = {
+        "black": np.uint64,
+        "white": np.uint64,
+        "player": np.int8,
+        "moves": np.uint64,
+        "square": np.int8,
+        "terminal": np.bool_,
+        "score": np.int8,
+        "value": np.float64,
+        "visits": np.float64,
+        "virtual_losses": np.float64,
+        "policy_prior": np.float64,
+        "first_child": np.int32,
+        "n_children": np.int32,
+    }
+
+    def __init__(self, capacity: int = INITIAL_POOL_SIZE) -> None:
+        self.size = 0
+        for name in self._DTYPES:
+            setattr(self, name, self._unallocated(name, capacity))
+
+    def _unallocated(self, name: str, capacity: int) -> np.ndarray:
+        fill = -1 if name == "first_child" else 0
+        return np.full(capacity, fill, dtype=self._DTYPES[name])
+
+    def reserve(self, n_nodes: int) -> None:
+        """
+        Make room to allocate n_nodes more nodes.
+        """
+        capacity = len(self.visits)
+        if self.size + n_nodes <= capacity:
+            return
+
+        capacity = max(2 * capacity, self.size + n_nodes)
+        for name in self._DTYPES:
+            array = self._unallocated(name, capacity)
+            array[: self.size] = getattr(self, name)[: self.size]  # noqa
+            setattr(self, name, array)
+
+    def alloc(
+        self,
+        board: Board,
+        move: Loc,
+        player: PlayerColor,
+        policy_prior: float = 0,
+        moves: Optional[Bitboard] = None,
+    ) -> int:
+        """
+        Allocate a node. moves are player's legal moves, if the caller already found
+        them.
+        """
+        if moves is None:
+            moves = board.find_moves(player)
+
+        self.reserve(1)
+        node = self.size
+        self.size += 1
+
+        self.black[node], self.white[node] = board
+        self.player[node] = player
+        self.moves[node] = moves
+        self.square[node] = move.as_int
+        self.policy_prior[node] = policy_prior
+        if not moves and not board.has_moves(player.opponent):
+            self.terminal[node] = True
+            self.score[node] = board.score_for_player(player)
+        return node
+
+    def subtree(self, root: int) -> "NodePool":
+        """
+        Copy the subtree under root into a new pool, where it is rooted at node 0.
+        """
+        order, first_child = subtree_order(self.first_child, self.n_children, root)
+        pool = NodePool(max(INITIAL_POOL_SIZE, 2 * len(order)))
+        pool.size = len(order)
+        for name in self._DTYPES:
+            getattr(pool, name)[: pool.size] = getattr(self, name)[order]  # noqa
+        pool.first_child[: pool.size] = first_child  # noqa
+        return pool
+
+    def board(self, node: int) -> Board:
+        return Board(int(self.black[node]), int(self.white[node]))
+
+    def player_color(self, node: int) -> PlayerColor:
+        return PlayerColor(int(self.player[node]))
+
+    def view(self, node: int) -> Tuple[Bitboard, Bitboard]:
+        """
+        The (my board, opponent board) view for the player to move, as
+        board(node).player_view would give, read straight from the arrays.
+        """
+        black, white = int(self.black[node]), int(self.white[node])
+        return (white, black) if self.player[node] else (black, white)
+
+    def move(self, node: int) -> Loc:
+        square = int(self.square[node])
+        return Loc.pass_loc() if square < 0 else Loc.from_int(square)
+
+    def children(self, node: int) -> range:
+        first = int(self.first_child[node])
+        return range(first, first + int(self.n_children[node]))
 
 
 # TODO: Dirichlet noise option
 class SearchTree:
-    board: Board
-    move: Loc
-    next_moves: Optional[Dict[Loc, "SearchTree"]]  # None when we've never been visited
-    player: PlayerColor
-    value: float
-    visits: int
-    policy_prior: float
+    """
+    A search tree stored in a NodePool, rooted at the current position.
+    Nodes are referred to by their index in the pool.
+    """
+
+    pool: NodePool
+    root: int
 
     def __init__(
         self, board: Board, move: Loc, player: PlayerColor, policy_prior: float
     ):
-        self.board = board
-        self.move = move
-        self.next_moves = None
-        self.player = player
-        self.value = board.score_for_player(player) if board.is_terminal else 0
-        self.visits = 0
-        self.policy_prior = policy_prior
+        self.pool = NodePool()
+        self.root = self.pool.alloc(board, move, player, policy_prior)
+
+    def reroot(self, node: int) -> None:
+        """
+        Make node the root, freeing the rest of the tree.
+        """
+        self.pool = self.pool.subtree(node)
+        self.root = 0
 
     @property
-    def _board_array(self) -> np.ndarray:
-        mine, opp = self.board.player_view(self.player)
-        return np.dstack([mine.piecearray, opp.piecearray])
-
-    def _puct_score(self, parent_visits: int, explore_coeff: float) -> float:
-        exploit = -self.value / self.visits if self.visits else 0
-        explore = self.policy_prior * math.sqrt(parent_visits) / (1 + self.visits)
-        return explore_coeff * explore + exploit
-
-    def _make_child(self, move: Loc, policy_prior: float) -> "SearchTree":
-        board = self.board.resolve_move(move, self.player)
-        player = (
-            self.player.opponent
-            if board.has_moves(self.player.opponent)
-            else self.player
-        )
-        return SearchTree(board, move, player, policy_prior)
-
-    def _next_simulation_move(self, explore_coeff: float) -> "SearchTree":
-        assert self.next_moves
-        subtrees = list(self.next_moves.values())
-        scores = map(lambda t: t._puct_score(self.visits, explore_coeff), subtrees)
-        move_idx = np.argmax(list(scores))
-        return subtrees[move_idx]
-
-    def _expand(self, evaluator: Evaluator) -> float:
-        assert self.next_moves is None, "Can only expand an unvisited node"
-
-        policy, value = evaluator(self._board_array)
-
-        # Mask illegal moves and re-normalize
-        move_bitboard = self.board.find_moves(self.player)
-        policy[np.where(~move_bitboard.piecearray)] = -math.inf
-        policy = softmax(policy)
-        self.next_moves = {
-            loc: self._make_child(loc, policy[loc.y, loc.x])
-            for loc in move_bitboard.loc_list
-        }
-
-        self.visits = 1
-        self.value = value
-        return value
+    def move(self) -> Loc:
+        return self.pool.move(self.root)
 
-    def simulate(self, evaluator: Evaluator, explore_coeff: float) -> float:
-        if self.board.is_terminal:
-            return self.value
-
-        if self.next_moves is None:
-            return self._expand(evaluator)
-
-        next_move = self._next_simulation_move(explore_coeff)
-        value = next_move.simulate(evaluator, explore_coeff)
-        if self.player != next_move.player:
-            value *= -1
-        self.value += value
-        self.visits += 1
+    @property
+    def visits(self) -> int:
+        return int(self.pool.visits[self.root])
+
+    def find_child(self, node: int, move: Loc) -> Optional[int]:
+        """
+        Find the child reached by playing move, if node has been visited.
+        """
+        children = self.pool.children(node)
+        squares = self.pool.square[children.start : children.stop]  # noqa
+        matches = np.flatnonzero(squares == move.as_int)
+        if not len(matches):
+            return None
+        return children.start + int(matches[0])
+
+    def _make_child(self, board: Board, player: PlayerColor, move: Loc) -> int:
+        board = board.resolve_move(move, player)
+        opponent_moves = board.find_moves(player.opponent)
+        if opponent_moves:
+            return self.pool.alloc(board, move, player.opponent, moves=opponent_moves)
+        return self.pool.alloc(board, move, player)
+
+    def _expand(self, node: int, evaluator: Evaluator) -> float:
+        policies, values = evaluator(_board_arrays([self.pool.view(node)]))
+        return self._expand_from(node, policies[0], values[0])
+
+    def _expand_from(self, node: int, policy: np.ndarray, value: float) -> float:
+        pool = self.pool
+        assert pool.first_child[node] < 0, "Can only expand an unvisited node"
+
+        # Mask illegal moves and re-normalize, in a copy since policies may be shared
+        board = pool.board(node)
+        player = pool.player_color(node)
+        move_bitboard = int(pool.moves[node])
+        legal = piecearray(move_bitboard)
+        policy = _softmax(np.where(legal, policy, -math.inf))
+
+        # Allocated one after another, so the children are contiguous.
+        # Moves are iterated in row-major order, the same order as policy[legal].
+        first = pool.size
+        for loc in iter_locs(move_bitboard):
+            self._make_child(board, player, loc)
+        pool.policy_prior[first : pool.size] = policy[legal]  # noqa
+
+        pool.first_child[node] = first
+        pool.n_children[node] = pool.size - first
+        pool.visits[node] = 1
+        pool.value[node] = value
         return value
 
-    def best_move(self, deterministic: bool = True) -> "SearchTree":
-        assert self.next_moves
-        subtrees = list(self.next_moves.values())
-        scores = list(map(lambda x: x.visits, subtrees))
-        if deterministic:
-            move_idx = np.argmax(scores)
-        else:
-            move_idx = np.random.choice(len(scores), p=scores)
-        return subtrees[move_idx]
+    def _select_path(self, explore_coeff: float) -> List[int]:
+        """
+        Follow PUCT scores from the root to a leaf.
+        Returns the path, starting with the root.
+        """
+        pool = self.pool
+        return select_puct_path(
+            pool.value,
+            pool.visits,
+            pool.virtual_losses,
+            pool.policy_prior,
+            pool.first_child,
+            pool.n_children,
+            self.root,
+            explore_coeff,
+        )
 
-    def __repr__(self) -> str:
-        if self.board.is_terminal:
-            return f"{self.move}: terminal ({self.board.winning_player})"
-        if not self.next_moves:
-            return f"{self.move}: unvisited"
+    def simulate(self, evaluator: Evaluator, explore_coeff: float) -> float:
+        """
+        Run one simulation. Returns the value it found for the player at the root.
+        """
+        path = self._select_path(explore_coeff)
+        leaf = path[-1]
+        if self.pool.terminal[leaf]:
+            return self._backpropagate(path, self.pool.score[leaf])
+        return self._backpropagate(path, self._expand(leaf, evaluator))
+
+    def _descend(self, explore_coeff: float) -> List[int]:
+        """
+        Select a path as simulate does, then add a virtual loss to every node entered.
+        """
+        path = self._select_path(explore_coeff)
+
+        # Applied afterwards, so that a descent never sees its own losses
+        self.pool.virtual_losses[path[1:]] += VIRTUAL_LOSS
+        return path
+
+    def _remove_virtual_loss(self, path: List[int]) -> None:
+        self.pool.virtual_losses[path[1:]] -= VIRTUAL_LOSS
+
+    def _backpropagate(self, path: List[int], value: float) -> float:
+        """
+        Back up a leaf's value along a path from the root.
+        Returns the value for the player at the root.
+        """
+        pool = self.pool
+        return backup_value(pool.value, pool.visits, pool.player, path, value)
+
+    def simulate_batch(
+        self,
+        evaluator: Evaluator,
+        explore_coeff: float,
+        batch_size: int,
+        evaluations: Optional[Evaluations] = None,
+    ) -> int:
+        """
+        Run up to batch_size simulations, evaluating all of their new leaves with a
+        single evaluator call. Returns the number of simulations backed up.
+
+        Virtual losses steer each descent away from paths already awaiting
+        evaluation. A descent that still reaches a pending leaf is dropped, and not
+        counted. The first descent is never dropped.
+
+        Leaves whose view is in evaluations, such as transpositions of boards
+        already expanded, reuse the cached output instead of being evaluated again.
+        New evaluations are added to it.
+        """
+        if evaluations is None:
+            evaluations = {}
+
+        pool = self.pool
+        pending: List[List[int]] = []
+        n_terminal = 0
+        for _ in range(batch_size):
+            path = self._descend(explore_coeff)
+            leaf = path[-1]
+            if pool.terminal[leaf]:
+                self._remove_virtual_loss(path)
+                self._backpropagate(path, pool.score[leaf])
+                n_terminal += 1
+            elif any(leaf == other[-1] for other in pending):
+                self._remove_virtual_loss(path)
+            else:
+                pending.append(path)
+
+        if not pending:
+            return n_terminal
+
+        keys = [self.pool.view(path[-1]) for path in pending]
+        missing = [key for key in dict.fromkeys(keys) if key not in evaluations]
+        if missing:
+            policies, values = evaluator(_board_arrays(missing))
+            evaluations.update(zip(missing, zip(policies, values)))
+
+        # _expand_from leaves policies unchanged, so they can be shared between nodes
+        for path, key in zip(pending, keys):
+            self._remove_virtual_loss(path)
+            self._backpropagate(path, self._expand_from(path[-1], *evaluations[key]))
+        return n_terminal + len(pending)
+
+    def best_move(self, deterministic: bool = True) -> int:
+        pool = self.pool
+        assert pool.n_children[self.root]
+        first = int(pool.first_child[self.root])
+        # Children are contiguous, so their visit counts are already an array
+        visits = pool.visits[first : first + pool.n_children[self.root]]  # noqa
+        # Sampling needs at least one visited child, which a short search may lack
+        if deterministic or not visits.any():
+            return first + int(visits.argmax())
+
+        # Sample in proportion to visits, without normalizing them first
+        # Searching right of ties skips children that were never visited
+        cumulative = np.cumsum(visits)
+        draw = _rng.random() * cumulative[-1]
+        return first + int(cumulative.searchsorted(draw, "right"))
+
+    def describe(self, node: int) -> str:
+        pool = self.pool
+        move = pool.move(node)
+        if pool.terminal[node]:
+            return f"{move}: terminal ({pool.board(node).winning_player})"
+        if not pool.n_children[node]:
+            return f"{move}: unvisited"
 
         return (
-            f"{self.move}: visited (vs: {self.visits}, "
-            f"ev: {self.value / self.visits:.3f}, "
-            f"prior: {self.policy_prior:.3f})"
+            f"{move}: visited (vs: {pool.visits[node]:.0f}, "
+            f"ev: {pool.value[node] / pool.visits[node]:.3f}, "
+            f"prior: {pool.policy_prior[node]:.3f})"
         )
 
+    def __repr__(self) -> str:
+        return self.describe(self.root)
+
     def summary(self) -> str:
-        if self.board.is_terminal or not self.next_moves:
+        pool = self.pool
+        node = self.root
+        if pool.terminal[node] or not pool.n_children[node]:
             return self.__repr__()
 
-        move_visits = ", ".join([str(tree.visits) for tree in self.next_moves.values()])
+        move_visits = ", ".join(
+            [f"{pool.visits[child]:.0f}" for child in pool.children(node)]
+        )
 
-        return f"""{self.move}: visited
-    Visits: {self.visits}
-    Expected value: {self.value / self.visits:.3f}
-    Policy prior: {self.policy_prior:.3f}
+        return f"""{pool.move(node)}: visited
+    Visits: {pool.visits[node]:.0f}
+    Expected value: {pool.value[node] / pool.visits[node]:.3f}
+    Policy prior: {pool.policy_prior[node]:.3f}
     Subtree visits: [{move_visits}]"""
 
 
@@ -136,6 +432,8 @@ class AlphaZeroPlayer(PlayerABC):
     finalized: bool
     time_buffer: int  # For fixed-time gameplay
     sims_per_turn: Optional[int]  # For fixed-moves gameplay
+    batch_size: int  # Simulations per evaluator call
+    evaluations: Evaluations
 
     def __init__(
         self,
@@ -144,64 +442,89 @@ class AlphaZeroPlayer(PlayerABC):
         finalized: bool = False,
         time_buffer: int = 80,
         sims_per_turn: Optional[int] = None,
+        batch_size: int = 1,
     ) -> None:
         self.evaluator = evaluator  # type: ignore
         self.explore_coeff = explore_coeff
         self.finalized = finalized
         self.time_buffer = time_buffer
         self.sims_per_turn = sims_per_turn
+        self.batch_size = batch_size
+        self.evaluations = {}
         self.search_tree = SearchTree(
-            Board.starting_board(), Loc.pass_loc(), PlayerColor.BLACK, 1
+            STARTING_BOARD, Loc.pass_loc(), PlayerColor.BLACK, 1
         )
 
     def _get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int]
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
     ) -> Loc:
         if opponent_move:
-            if self.search_tree.next_moves:
-                self.search_tree = self.search_tree.next_moves[opponent_move]
+            tree = self.search_tree
+            child = tree.find_child(tree.root, opponent_move)
+            if child is not None:
+                tree.reroot(child)
             else:
                 self.logger.warning(
                     "Opponent's move not considered. Generating a new tree..."
                 )
                 self.search_tree = SearchTree(board, opponent_move, self.color, 1)
 
-            self.logger.debug(f"Opponent's node: {self.search_tree}")
+            self.logger.debug("Opponent's node: %s", self.search_tree)
 
             if not self.search_tree.visits:
                 self.logger.warning("Off tree!")
 
-        if not board.has_moves(self.color):
+        if not legal_moves:
             return Loc.pass_loc()
 
-        t1 = monotonic()
+        if len(self.evaluations) > MAX_CACHED_EVALUATIONS:
+            self.evaluations.clear()
+
+        t1 = monotonic_ns()
         if ms_left:  # Constant time
-            empties = BOARD_SQUARES - board.white.popcount - board.black.popcount
+            empties = BOARD_SQUARES - popcount(board.black | board.white)
             n_moves_left = math.ceil(empties / 2)
             time_per_turn = ms_left / n_moves_left
+            budget_ns = int((time_per_turn - self.time_buffer) * 1_000_000)
 
             n_sims = 0
-            while monotonic() * 1000 - (t1 * 1000) < time_per_turn - self.time_buffer:
-                self.search_tree.simulate(
-                    self.evaluator, self.explore_coeff  # type: ignore
+            while monotonic_ns() - t1 < budget_ns:
+                n_sims += self.search_tree.simulate_batch(
+                    self.evaluator,  # type: ignore
+                    self.explore_coeff,
+                    self.batch_size,
+                    self.evaluations,
                 )
-                n_sims += 1
 
         else:  # Constant number of simulations per move
             assert self.sims_per_turn
-            n_sims = self.sims_per_turn
-            for _ in range(self.sims_per_turn):
-                self.search_tree.simulate(
-                    self.evaluator, self.explore_coeff  # type: ignore
+            n_sims = 0
+            while n_sims < self.sims_per_turn:
+                batch_size = min(self.batch_size, self.sims_per_turn - n_sims)
+                n_sims += self.search_tree.simulate_batch(
+                    self.evaluator,  # type: ignore
+                    self.explore_coeff,
+                    batch_size,
+                    self.evaluations,
                 )
 
-        self.search_tree = self.search_tree.best_move(deterministic=self.finalized)
+        self.search_tree.reroot(
+            self.search_tree.best_move(deterministic=self.finalized)
+        )
 
-        move_time = monotonic() - t1
+        move_time = (monotonic_ns() - t1) / 1e9
         self.logger.debug(
-            f"Completed {n_sims} simulations in {move_time:.2f} seconds "
-            f"({n_sims / move_time:.2f} sims/sec)."
+            "Completed %d simulations in %.2f seconds (%.2f sims/sec).",
+            n_sims,
+            move_time,
+            n_sims / move_time,
         )
-        self.logger.debug(f"Chosen node: {self.search_tree.summary()}")
+        # Summaries are built from the whole root, so only when they will be shown
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Chosen node: %s", self.search_tree.summary())
 
         return self.search_tree.move
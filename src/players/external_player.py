@@ -6,7 +6,7 @@ import os
 import subprocess
 from typing import Optional
 
-from board import Board, Loc, PlayerColor
+from board import Bitboard, Board, Loc, PlayerColor
 from player import PlayerABC
 
 
@@ -19,7 +19,7 @@ class ExternalPlayer(PlayerABC):
 
     def initialize(self, color: PlayerColor, ms_total: Optional[int]) -> None:
         self.process = subprocess.Popen(
-            f"{self.player_command} {color.value.capitalize()}",
+            f"{self.player_command} {color.name.capitalize()}",
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             shell=True,
@@ -28,7 +28,11 @@ class ExternalPlayer(PlayerABC):
         self.logger.info(self.process.stdout.readline().decode("utf-8"))
 
     def _get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int] = None
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
     ) -> Loc:
         if opponent_move is None:
             opponent_move = Loc.pass_loc()
@@ -36,10 +40,12 @@ class ExternalPlayer(PlayerABC):
         if ms_left is None:
             ms_left = -1
 
+        # Protocol lines are ASCII, so they are formatted and parsed as bytes.
+        # The write is buffered, so flushing sends the whole line in one syscall.
         self.process.stdin.write(
-            bytes(f"{opponent_move.x} {opponent_move.y} {ms_left}\n", "utf-8")
+            b"%d %d %d\n" % (opponent_move.x, opponent_move.y, ms_left)
         )
         self.process.stdin.flush()
 
-        x, y = self.process.stdout.readline().decode("utf-8").strip().split()
+        x, y = self.process.stdout.readline().split()
         return Loc(int(x), int(y))
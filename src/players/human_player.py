@@ -3,7 +3,7 @@ from typing import Optional
 
 import numpy as np  # type: ignore
 
-from board import BOARD_SIZE, Board, Loc
+from board import BOARD_SIZE, Bitboard, Board, Loc, loc_list, piecearray
 from player import PlayerABC
 
 
@@ -16,17 +16,20 @@ def _parse_input(input_: str) -> Loc:
 
 class HumanPlayer(PlayerABC):
     def _get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int] = None
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
     ) -> Loc:
-        moves_bitboard = board.find_moves(self.color)
-        all_moves = moves_bitboard.loc_list
+        all_moves = loc_list(legal_moves)
         board_rep = board._string_array()
-        board_rep[1:, 1:][np.where(moves_bitboard.piecearray)] = "-"
+        board_rep[1:, 1:][np.where(piecearray(legal_moves))] = "-"
         self.logger.info("\n" + np.array2string(board_rep, formatter={"numpystr": str}))
-        self.logger.info(f"To move: {self.color.value}.")
+        self.logger.info(f"To move: {self.color.name.lower()}.")
         self.logger.info(f"Legal moves: {all_moves}")
 
-        if not board.has_moves(self.color):
+        if not legal_moves:
             return Loc.pass_loc()
 
         while True:
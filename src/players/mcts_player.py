@@ -1,128 +1,388 @@
+import multiprocessing
+import multiprocessing.pool
 import random
-from math import ceil, log, sqrt
-from time import time
-from typing import Dict, List, Optional
+from math import ceil
+from time import time_ns
+from typing import Dict, Optional, Tuple
 
 import numpy as np  # type: ignore
 
-from board import BOARD_SQUARES, Board, GameOutcome, Loc, PlayerColor
-from mcts_utils import random_rollout  # type: ignore
+from board import (
+    BOARD_SQUARES,
+    STARTING_BOARD,
+    Bitboard,
+    Board,
+    GameOutcome,
+    Loc,
+    PlayerColor,
+    popcount,
+    square_list,
+)
+from mcts_utils import (  # type: ignore
+    backup_outcome,
+    random_rollout,
+    seed_rollouts,
+    select_uct_path,
+    subtree_order,
+)
 from player import PlayerABC
 
 DEFAULT_N_TRAVERSALS = 100
 
 
+# Nodes allocated up front. The pool doubles in size whenever it fills.
+INITIAL_POOL_SIZE = 2 ** 16
+
+
+class NodePool:
+    """
+    Search tree nodes, stored as parallel arrays indexed by node number.
+
+    When a node is set up, a contiguous range of child nodes is reserved for it, one
+    per legal move: first_child[node] : first_child[node] + n_moves[node]. The first
+    n_explored[node] children have been explored, in the order they were explored.
+    The rest only hold the move they stand for.
+    """
+
+    size: int  # Nodes reserved so far
+    move: np.ndarray  # Square (Loc.as_int) of the move which led to each node
+    black: np.ndarray
+    white: np.ndarray
+    player: np.ndarray  # The player to move
+    value: np.ndarray  # Total outcome for the player who moved into the node
+    visits: np.ndarray  # Floats, so that UCT arithmetic needs no casts
+    first_child: np.ndarray
+    n_moves: np.ndarray
+    n_explored: np.ndarray
+
+    _DTYPES = {
+        "move": np.int8,
+        "black": np.uint64,
+        "white": np.uint64,
+        "player": np.int8,
+        "value": np.float64,
+        "visits": np.float64,
+        "first_child": np.int32,
+        "n_moves": np.int32,
+        "n_explored": np.int32,
+    }
+
+    def __init__(self, capacity: int = INITIAL_POOL_SIZE) -> None:
+        self.size = 0
+        for name, dtype in self._DTYPES.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def reserve(self, n_nodes: int) -> int:
+        """
+        Reserve n_nodes contiguous, zeroed nodes. Returns the first one.
+        May reallocate the pool's arrays.
+        """
+        first = self.size
+        self.size += n_nodes
+        capacity = len(self.visits)
+        if self.size > capacity:
+            capacity = max(2 * capacity, self.size)
+            for name in self._DTYPES:
+                array = np.zeros(capacity, dtype=self._DTYPES[name])
+                array[:first] = getattr(self, name)[:first]
+                setattr(self, name, array)
+        return first
+
+    def set_up(
+        self,
+        node: int,
+        board: Board,
+        player: PlayerColor,
+        move_bitboard: Optional[Bitboard] = None,
+    ) -> None:
+        """
+        Store a reserved node's position, and reserve its children.
+        move_bitboard holds player's legal moves, if the caller already found them.
+        """
+        if move_bitboard is None:
+            move_bitboard = board.find_moves(player)
+        moves = square_list(move_bitboard)
+        first = self.reserve(len(moves))
+        self.move[first : self.size] = moves  # noqa
+        self.black[node], self.white[node] = board
+        self.player[node] = player
+        self.first_child[node] = first
+        self.n_moves[node] = len(moves)
+
+    def subtree(self, root: int) -> "NodePool":
+        """
+        Copy the subtree under root into a new pool, where it is rooted at node 0.
+        """
+        order, first_child = subtree_order(self.first_child, self.n_moves, root)
+        pool = NodePool(max(INITIAL_POOL_SIZE, 2 * len(order)))
+        pool.size = len(order)
+        for name in self._DTYPES:
+            getattr(pool, name)[: pool.size] = getattr(self, name)[order]  # noqa
+        pool.first_child[: pool.size] = first_child  # noqa
+        return pool
+
+    def board(self, node: int) -> Board:
+        return Board(int(self.black[node]), int(self.white[node]))
+
+    def player_color(self, node: int) -> PlayerColor:
+        return PlayerColor(int(self.player[node]))
+
+    def view(self, node: int) -> Tuple[Bitboard, Bitboard]:
+        """
+        The (my board, opponent board) view for the player to move, as
+        board(node).player_view would give, read straight from the arrays.
+        """
+        black, white = int(self.black[node]), int(self.white[node])
+        return (white, black) if self.player[node] else (black, white)
+
+    def explored(self, node: int) -> slice:
+        first = self.first_child[node]
+        return slice(first, first + self.n_explored[node])
+
+
 class SearchTree:
+    """
+    A search tree stored in a NodePool, rooted at the current position.
+    Nodes are referred to by their index in the pool.
+    """
+
+    explore_coeff: float
+    pool: NodePool
+    root: int
+
     def __init__(self, board: Board, player: PlayerColor, explore_coeff: float):
         self.explore_coeff = explore_coeff
-        self.player = player
-        self.board: Board = board
-        self.value: float = 0
-        self.visits: int = 0
-        self.unexplored: List[Loc] = board.find_moves(player).loc_list
-        self.explored: Dict[Loc, SearchTree] = {}
+        self.pool = NodePool()
+        self.root = self.pool.reserve(1)
+        self.pool.set_up(self.root, board, player)
+
+    def reroot(self, node: int) -> None:
+        """
+        Make node the root, freeing the rest of the tree.
+        """
+        self.pool = self.pool.subtree(node)
+        self.root = 0
 
     @property
-    def _value_summary(self) -> str:
-        return f"""vs={self.visits}; ev={self.value / self.visits:.3f}"""
+    def value(self) -> float:
+        return float(self.pool.value[self.root])
 
-    def _uct_score(self, parent_visits: int) -> float:
-        return (self.value / self.visits) + self.explore_coeff * sqrt(
-            log(parent_visits) / self.visits
-        )
+    @property
+    def visits(self) -> int:
+        return int(self.pool.visits[self.root])
 
-    def _apply_game_outcome(self, result: GameOutcome) -> None:
-        self.visits += 1
-        if result == GameOutcome.DRAW:
-            self.value += 0.5
-        elif result.value != self.player.value:
-            self.value += 1
+    def root_visits(self) -> Dict[int, int]:
+        """
+        Map each explored move from the root, as a square, to its visit count.
+        """
+        children = self.pool.explored(self.root)
+        squares = self.pool.move[children].tolist()
+        return dict(zip(squares, map(int, self.pool.visits[children])))
 
-    def _random_rollout(self) -> GameOutcome:
-        active, opp = self.board.player_view(self.player)
-        result = random_rollout(active, opp, self.player)
-        return result
+    def find_child(self, node: int, move: Loc) -> Optional[int]:
+        """
+        Find the explored child reached by playing move.
+        """
+        children = self.pool.explored(node)
+        matches = np.flatnonzero(self.pool.move[children] == move.as_int)
+        if not len(matches):
+            return None
+        return children.start + int(matches[0])
 
-    def traverse(self) -> GameOutcome:
-        if self.unexplored:
-            next_move = random.choice(self.unexplored)
-            self.unexplored.remove(next_move)
-            next_board = self.board.resolve_move(next_move, self.player)
-            next_player = (
-                self.player.opponent
-                if next_board.has_moves(self.player.opponent)
-                else self.player
-            )
+    def _random_rollout(self, node: int) -> GameOutcome:
+        player = self.pool.player_color(node)
+        active, opp = self.pool.view(node)
+        return random_rollout(active, opp, player)
+
+    def _expand(self, node: int) -> int:
+        pool = self.pool
+        child = pool.first_child[node] + pool.n_explored[node]
+        n_unexplored = pool.n_moves[node] - pool.n_explored[node]
+
+        # Swap a random untried move into the first unexplored child
+        moves = pool.move
+        untried = child + random.randrange(n_unexplored)
+        square = moves[untried]
+        moves[untried] = moves[child]
+        moves[child] = square
 
-            next_node = SearchTree(next_board, next_player, self.explore_coeff)
-            self.explored[next_move] = next_node
-            result = next_node._random_rollout()
-            next_node._apply_game_outcome(result)
+        player = pool.player_color(node)
+        next_board = pool.board(node).resolve_move(Loc.from_int(int(square)), player)
+        opponent_moves = next_board.find_moves(player.opponent)
+        if opponent_moves:
+            pool.set_up(child, next_board, player.opponent, opponent_moves)
         else:
-            if self.explored == {}:  # Terminal node
-                return self.board.winning_player
+            pool.set_up(child, next_board, player)
+        pool.n_explored[node] += 1
+        return int(child)
 
-            # All children explored: pick one based on UCT scores, continue searching
-            next_nodes = list(self.explored.values())
-            uct_scores = [node._uct_score(self.visits) for node in next_nodes]
-            next_node = next_nodes[np.argmax(uct_scores)]
-            result = next_node.traverse()
+    def traverse(self) -> GameOutcome:
+        pool = self.pool
+
+        # Pick children by UCT score while all of their siblings have been explored
+        path = select_uct_path(
+            pool.value,
+            pool.visits,
+            pool.first_child,
+            pool.n_moves,
+            pool.n_explored,
+            self.root,
+            self.explore_coeff,
+        )
+        node = path[-1]
+        if pool.n_moves[node]:
+            node = self._expand(node)
+            path.append(node)
+            result = self._random_rollout(node)
+        else:  # Terminal node, which records no outcomes
+            path.pop()
+            result = pool.board(node).winning_player
 
-        self._apply_game_outcome(result)
+        backup_outcome(pool.value, pool.visits, pool.player, path, result.value)
         return result
 
 
+def _search_worker(
+    board: Board, player: PlayerColor, explore_coeff: float, deadline: int, seed: int
+) -> Dict[int, int]:
+    """
+    Search a new tree from board until deadline (in ns since the epoch), in a worker
+    process. Returns the visit count of each move from the root, keyed by square.
+    """
+    # Forked workers would otherwise all share the parent's random state
+    random.seed(seed)
+    seed_rollouts(seed)
+
+    search_tree = SearchTree(board, player, explore_coeff)
+    while time_ns() < deadline:
+        search_tree.traverse()
+    return search_tree.root_visits()
+
+
 class MCTSPlayer(PlayerABC):
-    def __init__(self, explore_coeff: float, turn_ms_buffer: int = 0) -> None:
+    """
+    Monte Carlo tree search with random rollouts.
+
+    Under a time limit, n_workers > 1 adds root parallelism: n_workers - 1 worker
+    processes each search their own tree from the current position while this one
+    searches, and moves are chosen by their visit counts summed over all the trees.
+    """
+
+    n_workers: int
+    _workers: Optional[multiprocessing.pool.Pool]
+
+    def __init__(
+        self, explore_coeff: float, turn_ms_buffer: int = 0, n_workers: int = 1
+    ) -> None:
         self.explore_coeff = explore_coeff
         self.search_tree: SearchTree = SearchTree(
-            Board.starting_board(), PlayerColor.BLACK, self.explore_coeff
+            STARTING_BOARD, PlayerColor.BLACK, self.explore_coeff
         )
         self.turn_ms_buffer = turn_ms_buffer
+        self.n_workers = n_workers
+        self._workers = None
+
+    def initialize(self, color: PlayerColor, ms_total: Optional[int]) -> None:
+        super().initialize(color, ms_total)
+        # Started for each game, so process startup is not charged to a timed move
+        if self.n_workers > 1 and self._workers is None:
+            self._workers = multiprocessing.Pool(self.n_workers - 1)
+
+    def close(self) -> None:
+        if self._workers is not None:
+            self._workers.terminate()
+            self._workers.join()
+            self._workers = None
 
     def _get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int]
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
     ) -> Loc:
+        child = None
+        if opponent_move is not None:
+            child = self.search_tree.find_child(self.search_tree.root, opponent_move)
+
         if opponent_move is None:
             pass  # Keep tree the same
-        elif opponent_move in self.search_tree.explored.keys():
-            self.search_tree = self.search_tree.explored[opponent_move]  # type: ignore
+        elif child is not None:
+            self.search_tree.reroot(child)
             self.logger.debug(
-                f"""Opponent's node:
-        Expected value: {self.search_tree.value / self.search_tree.visits:.2f}
-        Visits: {self.search_tree.visits}"""
+                """Opponent's node:
+        Expected value: %.2f
+        Visits: %d""",
+                self.search_tree.value / self.search_tree.visits,
+                self.search_tree.visits,
             )
         else:
             self.logger.warning("Off tree! Generating a new search tree...")
             self.search_tree = SearchTree(board, self.color, self.explore_coeff)
 
-        if not board.has_moves(self.color):
+        if not legal_moves:
             return Loc.pass_loc()
 
         if ms_left:
-            t1 = time() * 1000
-            empties = BOARD_SQUARES - board.white.popcount - board.black.popcount
+            t1 = time_ns()
+            empties = BOARD_SQUARES - popcount(board.black | board.white)
             n_moves_left = ceil(empties / 2)
             time_per_turn = ms_left / n_moves_left
 
+            deadline = t1 + int((time_per_turn - self.turn_ms_buffer) * 1_000_000)
+            worker_results = self._start_workers(board, deadline)
+
             n = 0
-            while time() * 1000 - t1 < time_per_turn - self.turn_ms_buffer:
+            while time_ns() < deadline:
                 self.search_tree.traverse()
                 n += 1
         else:
+            worker_results = None
             n = DEFAULT_N_TRAVERSALS
             for _ in range(DEFAULT_N_TRAVERSALS):
                 self.search_tree.traverse()
 
-        moves_and_nodes = list(self.search_tree.explored.items())
-        visit_counts = [node.visits for _, node in moves_and_nodes]
-        move_idx = np.argmax(visit_counts)
-        move, self.search_tree = moves_and_nodes[move_idx]
+        # Ties go to the move this tree explored first
+        visits = self.search_tree.root_visits()
+        for worker_visits in worker_results.get() if worker_results else ():
+            for square, count in worker_visits.items():
+                visits[square] = visits.get(square, 0) + count
+        move = Loc.from_int(max(visits, key=visits.__getitem__))
+
+        chosen = self.search_tree.find_child(self.search_tree.root, move)
+        if chosen is None:  # Only the workers explored this move
+            self.search_tree = self._tree_after_move(board, move)
+        else:
+            self.search_tree.reroot(chosen)
 
         self.logger.debug(
-            f"""Chosen node:
-    Expected value: {self.search_tree.value / self.search_tree.visits:.2f}
-    Visits: {self.search_tree.visits}
-    Traversals: {n}"""
+            """Chosen node:
+    Expected value: %.2f
+    Visits: %d
+    Traversals: %d""",
+            self.search_tree.value / max(self.search_tree.visits, 1),
+            visits[move.as_int],
+            n,
         )
         return move
+
+    def _start_workers(
+        self, board: Board, deadline: int
+    ) -> Optional[multiprocessing.pool.AsyncResult]:
+        """
+        Start the worker processes searching board until deadline, if there are any.
+        """
+        if self._workers is None:
+            return None
+
+        args = [
+            (board, self.color, self.explore_coeff, deadline, random.getrandbits(32))
+            for _ in range(self.n_workers - 1)
+        ]
+        return self._workers.starmap_async(_search_worker, args)
+
+    def _tree_after_move(self, board: Board, move: Loc) -> SearchTree:
+        next_board = board.resolve_move(move, self.color)
+        opponent = self.color.opponent
+        next_player = opponent if next_board.has_moves(opponent) else self.color
+        return SearchTree(next_board, next_player, self.explore_coeff)
@@ -1,15 +1,18 @@
-import random
 from typing import Optional
 
-from board import Board, Loc
+from board import Bitboard, Board, Loc, random_loc
 from player import PlayerABC
 
 
 class RandomPlayer(PlayerABC):
     def _get_move(
-        self, board: Board, opponent_move: Optional[Loc], ms_left: Optional[int] = None
+        self,
+        board: Board,
+        opponent_move: Optional[Loc],
+        ms_left: Optional[int],
+        legal_moves: Bitboard,
     ) -> Loc:
-        if not board.has_moves(self.color):
+        if not legal_moves:
             return Loc.pass_loc()
 
-        return random.choice(board.find_moves(self.color).loc_list)
+        return random_loc(legal_moves)
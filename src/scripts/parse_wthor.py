@@ -3,21 +3,38 @@ Code for working with the WThor database, available at
 http://www.ffothello.org/informatique/la-base-wthor/.
 """
 import logging
+import multiprocessing
 import os
 from glob import glob
-from typing import List, NamedTuple, Tuple, Union
+from typing import List, NamedTuple, Tuple
 
 import numpy as np  # type: ignore
 import tensorflow as tf  # type: ignore
 from absl import app, flags  # type: ignore
 
-from alphazero.data import serialize_example
-from board import Bitboard, Board, GameOutcome, Loc, PlayerColor
+from alphazero.data import serialize_examples
+from board import BOARD_SIZE, Board, GameOutcome, Loc, PlayerColor, replay_moves
 
 DB_HEADER_BYTES = 16
 GAME_BYTES = 68
 GAME_HEADER_BYTES = 8
 
+# A game record: (tournament, black player, white player, real score, theoretical
+# score) header bytes followed by one byte per move
+GAME_DTYPE = np.dtype(
+    [
+        ("header", np.uint8, GAME_HEADER_BYTES),
+        ("moves", np.uint8, GAME_BYTES - GAME_HEADER_BYTES),
+    ]
+)
+
+# Shape of each sample and dtype of the .npy files written, in GameSummary.to_data order
+SAMPLE_ARRAYS = {
+    "boards": ((2,), np.uint64),
+    "moves": ((2,), np.int8),
+    "values": ((), np.int8),
+}
+
 FLAGS = flags.FLAGS
 
 
@@ -36,94 +53,155 @@ class GameState(NamedTuple):
     player: PlayerColor
     move: Loc
 
-    # Format: (board [8x8x2 ndarray of (mine, opp)], move [x, y], value)
-    def to_data(self, winner: GameOutcome) -> Tuple[np.ndarray, Tuple[int, int], int]:
-        mine, opp = self.board.player_view(self.player)
-        board = np.dstack([mine.piecearray, opp.piecearray])
-
-        if winner == GameOutcome.DRAW:
-            value = 0
-        elif winner.value == self.player.value:
-            value = 1
-        else:
-            value = -1
-
-        return (board, (self.move.x, self.move.y), value)
-
     def __repr__(self) -> str:
-        return f"Next move: {self.player.value} plays {self.move}\n{self.board}"
+        return f"Next move: {self.player.name.lower()} plays {self.move}\n{self.board}"
 
 
 class GameSummary(NamedTuple):
+    """
+    A replayed game. The position before each move played is stored across parallel
+    arrays, one entry per state.
+    """
+
     real_score: int
     theoretical_score: int
-    states: List[GameState]
+    blacks: np.ndarray  # uint64 bitboards
+    whites: np.ndarray
+    players: np.ndarray  # The player to move, as int8 PlayerColor values
+    moves: np.ndarray  # (x, y) of the move played, as an (n, 2) int8 array
     outcome: GameOutcome
 
+    @property
+    def states(self) -> List[GameState]:
+        return [
+            GameState(Board(black, white), PlayerColor(player), Loc(x, y))
+            for black, white, player, (x, y) in zip(
+                self.blacks.tolist(),
+                self.whites.tolist(),
+                self.players.tolist(),
+                self.moves.tolist(),
+            )
+        ]
+
+    def to_data(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Convert every state to a sample at once, one row per state:
+        (boards [bitboards (mine, opp)], moves [x, y], values)
+        """
+        black_to_move = self.players == PlayerColor.BLACK
+        mine = np.where(black_to_move, self.blacks, self.whites)
+        opp = np.where(black_to_move, self.whites, self.blacks)
+
+        if self.outcome == GameOutcome.DRAW:
+            values = np.zeros(len(self.players), dtype=np.int8)
+        else:
+            won = self.players == self.outcome.value
+            values = np.where(won, 1, -1).astype(np.int8)
 
-def parse_move(move_encoding: int) -> Loc:
-    x = move_encoding % 10 - 1
-    y = move_encoding // 10 - 1
-    return Loc(x, y)
+        return np.stack([mine, opp], axis=-1), self.moves, values
 
 
-def parse_game(game_bytes: bytes) -> GameSummary:
-    assert len(game_bytes) == GAME_BYTES
+# The (x, y) each move byte encodes. Byte 0, which follows a game's last move,
+# decodes to a pass.
+MOVE_TABLE = np.array([(b % 10 - 1, b // 10 - 1) for b in range(256)], dtype=np.int8)
 
-    header_bytes = game_bytes[:GAME_HEADER_BYTES]
-    real_score = int(header_bytes[6])
-    theoretical_score = int(header_bytes[7])
 
-    move_bytes = game_bytes[GAME_HEADER_BYTES:]
-    board = Board.starting_board()
-    moves = list(map(parse_move, move_bytes))
-    player = PlayerColor.BLACK
-    states: List[GameState] = []
+def parse_move(move_encoding: int) -> Loc:
+    x, y = MOVE_TABLE[move_encoding].tolist()
+    return Loc(x, y)
+
 
-    for move in moves:
-        if move == Loc.pass_loc():
-            break
+def parse_moves(move_bytes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode an array of move bytes as parse_move does, into int8 arrays of x and y.
+    """
+    return MOVE_TABLE[move_bytes, 0], MOVE_TABLE[move_bytes, 1]
 
-        states.append(GameState(board, player, move))
-        board = board.resolve_move(move, player)
 
-        if board.has_moves(player.opponent):
-            player = player.opponent
+def parse_game(header: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> GameSummary:
+    """
+    Replay a game from its header bytes and its decoded move coordinates.
+    """
+    real_score = int(header[6])
+    theoretical_score = int(header[7])
+
+    blacks, whites, players, final_board = replay_moves(xs, ys)
+    moves = np.stack([xs, ys], axis=-1)[: len(players)]  # noqa
 
     return GameSummary(
         real_score=real_score,
         theoretical_score=theoretical_score,
-        states=states,
-        outcome=board.winning_player,
+        blacks=blacks,
+        whites=whites,
+        players=players,
+        moves=moves,
+        outcome=final_board.winning_player,
     )
 
 
 def parse_db(filename: str) -> List[GameSummary]:
-    logging.info(f"Parsing database: {filename}")
-
-    with open(filename, "rb") as f:
-        db_bytes = f.read()
-    data_bytes = db_bytes[DB_HEADER_BYTES:]
-
-    summaries = []
-    for i in range(len(data_bytes) // GAME_BYTES):
-        game_bytes = data_bytes[i * GAME_BYTES : (i + 1) * GAME_BYTES]  # noqa
-        summaries.append(parse_game(game_bytes))
-    return summaries
-
-
-def make_dataset(
-    boards: np.ndarray, moves: np.ndarray, values: np.ndarray
-) -> tf.data.Dataset:
-    def gen():
-        for i in range(boards.shape[0]):
-            black_bb = Bitboard.from_piecearray(boards[i, :, :, 0])
-            white_bb = Bitboard.from_piecearray(boards[i, :, :, 1])
-            board = Board.from_player_view(black_bb, white_bb, PlayerColor.BLACK)
-            move = Loc(moves[i, 0], moves[i, 1])
-            yield serialize_example(board, move, values[i])
+    logging.info("Parsing database: %s", filename)
+
+    # Mapped rather than read, so the OS pages games in as they are decoded
+    n_games = (os.path.getsize(filename) - DB_HEADER_BYTES) // GAME_BYTES
+    if n_games <= 0:  # Nothing to map
+        return []
+    games = np.memmap(
+        filename, dtype=GAME_DTYPE, mode="r", offset=DB_HEADER_BYTES, shape=n_games
+    )
 
-    return tf.data.Dataset.from_generator(gen, output_types=tf.string, output_shapes=())
+    # Decode every move in the database at once
+    xs, ys = parse_moves(games["moves"])
+    return [parse_game(games["header"][i], xs[i], ys[i]) for i in range(n_games)]
+
+
+def write_samples(
+    writer: tf.io.TFRecordWriter,
+    boards: np.ndarray,
+    moves: np.ndarray,
+    values: np.ndarray,
+) -> None:
+    """
+    Write samples, in the format of GameSummary.to_data, to a TFRecord file.
+    """
+    # Boards are (mine, opp), which are stored as (black, white)
+    squares = moves[:, 0] + BOARD_SIZE * moves[:, 1]  # Loc.as_int
+    for record in serialize_examples(boards[:, 0], boards[:, 1], squares, values):
+        writer.write(record)
+
+
+def write_db_shard(filename: str, shard_filename: str) -> int:
+    """
+    Stream a database's samples into a TFRecord file, one game at a time.
+    Returns the number of samples written.
+    """
+    n_samples = 0
+    with tf.io.TFRecordWriter(shard_filename) as writer:
+        for game in parse_db(filename):
+            boards, moves, values = game.to_data()
+            write_samples(writer, boards, moves, values)
+            n_samples += len(values)
+    return n_samples
+
+
+def save_db_samples(filename: str, out_dir: str, start: int) -> None:
+    """
+    Copy a database's samples into the dataset's .npy files in out_dir, one game at a
+    time, starting from row start.
+    """
+    outputs = [
+        np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode="r+")
+        for name in SAMPLE_ARRAYS
+    ]
+    for game in parse_db(filename):
+        samples = game.to_data()
+        end = start + len(game.players)
+        for output, array in zip(outputs, samples):
+            output[start:end] = array
+        start = end
+
+    for output in outputs:
+        output.flush()
 
 
 def main(_):
@@ -131,44 +209,35 @@ def main(_):
     os.makedirs(FLAGS.out_dir, exist_ok=True)
 
     db_files = glob(FLAGS.wthor_glob)
-    boards: Union[List[np.ndarray], np.ndarray] = []
-    moves: Union[List[Tuple[int, int]], np.ndarray] = []
-    values: Union[List[int], np.ndarray] = []
-
-    logging.info(f"Reading files: {db_files}")
-    logging.info(f"Writing files to: {FLAGS.out_dir}")
-
-    for filename in db_files:
-        games = parse_db(filename)
-
-        for game in games:
-            data_samples = map(lambda x: x.to_data(game.outcome), game.states)
-            new_boards, new_moves, new_values = zip(*data_samples)
-            boards.extend(new_boards)
-            moves.extend(new_moves)
-            values.extend(new_values)
-
-    boards = np.array(boards)
-    moves = np.array(moves)
-    values = np.array(values)
-
-    legal_indices = np.where(moves[:, 0] != -1)
-    boards = boards[legal_indices]
-    moves = moves[legal_indices]
-    values = values[legal_indices]
-
-    np.save(os.path.join(FLAGS.out_dir, "boards.npy"), boards)
-    np.save(os.path.join(FLAGS.out_dir, "moves.npy"), moves)
-    np.save(os.path.join(FLAGS.out_dir, "values.npy"), values)
-
-    logging.info("Writing TFRecord")
-    ds = make_dataset(boards, moves, values)
-    writer = tf.data.experimental.TFRecordWriter(
-        os.path.join(FLAGS.out_dir, "wthor.tfrecord")
-    )
-    writer.write(ds)
-
-    print("Done!")
+    n_shards = len(db_files)
+    shard_files = [
+        os.path.join(FLAGS.out_dir, f"wthor-{i:05d}-of-{n_shards:05d}.tfrecord")
+        for i in range(n_shards)
+    ]
+
+    logging.info("Reading files: %s", db_files)
+    logging.info("Writing files to: %s", FLAGS.out_dir)
+
+    # Each database is parsed and streamed into its own shard in its own process,
+    # so the whole dataset is never held in memory
+    with multiprocessing.Pool() as pool:
+        logging.info("Writing TFRecords")
+        counts = pool.starmap(write_db_shard, zip(db_files, shard_files))
+
+        # The .npy files are allocated on disk, then filled a database at a time
+        logging.info("Writing arrays")
+        n_samples = sum(counts)
+        for name, (shape, dtype) in SAMPLE_ARRAYS.items():
+            filename = os.path.join(FLAGS.out_dir, f"{name}.npy")
+            np.lib.format.open_memmap(
+                filename, mode="w+", dtype=dtype, shape=(n_samples,) + shape
+            ).flush()
+
+        starts = np.cumsum([0] + counts[:-1]).tolist()
+        out_dirs = [FLAGS.out_dir] * n_shards
+        pool.starmap(save_db_samples, zip(db_files, out_dirs, starts))
+
+    logging.info("Done!")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules import each other from src/, and the Cython extensions are built in place
+# at the repository root (python setup.py build_ext --inplace)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
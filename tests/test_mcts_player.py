@@ -0,0 +1,23 @@
+from game import play_game
+from players.mcts_player import MCTSPlayer
+from players.random_player import RandomPlayer
+
+
+def test_workers_search_in_every_game():
+    player = MCTSPlayer(explore_coeff=1.0, turn_ms_buffer=40, n_workers=2)
+    start_workers = player._start_workers
+    worker_moves = []
+
+    def count_worker_moves(board, deadline):
+        result = start_workers(board, deadline)
+        worker_moves[-1] += result is not None
+        return result
+
+    player._start_workers = count_worker_moves  # type: ignore
+
+    for _ in range(2):
+        worker_moves.append(0)
+        play_game(RandomPlayer(), player, max_time=4000)
+        assert player._workers is None  # Closed at the end of the game
+
+    assert all(worker_moves), worker_moves